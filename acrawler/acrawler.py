@@ -1,159 +1,340 @@
 import asyncio
 import aiohttp
 import os
-import hashlib
 import argparse
 import logging
+import lxml.html
+import concurrent.futures
 from collections import namedtuple
-from bs4 import BeautifulSoup
+from lxml import etree
+from frontier import Frontier, normalize_url, BLOOM_CAPACITY
+from storage import PageStore, SpooledBody, SEGMENT_SIZE, WRITE_QUEUE_SIZE, CHUNK_SIZE
+from scheduler import Scheduler, ServerBusy, is_busy_status, get_retry_after
+from scheduler import DOMAIN_RATE, DOMAIN_BURST, CRAWL_DELAY
+from cache import PageCache, CacheEntry, NOT_MODIFIED, get_validators, get_conditional_headers
+from metrics import CrawlMetrics, LagMonitor, MetricsReporter, METRICS_INTERVAL
 
 
 BASE_URL = 'https://news.ycombinator.com'
 COMMENTS_BASE_URL = 'https://news.ycombinator.com/item?id='
-
-Page = namedtuple('Page', ['url', 'html'])
+MAX_TOTAL_CONNECTIONS = 100
+DNS_CACHE_TTL = 300
+MAX_PAGE_SIZE = 10 * 1024 * 1024
+FRONTIER_NAME = 'frontier.sqlite3'
+CACHE_NAME = 'cache.sqlite3'
+PARSE_WORKERS = 2
+XPATH_TOPIC_ROWS = '//tr[contains(concat(" ", normalize-space(@class), " "), " athing ")]'
+XPATH_STORY_LINK = './/a[contains(concat(" ", normalize-space(@class), " "), " storylink ")]/@href'
+XPATH_LINKS = '//a/@href'
+
+Page = namedtuple('Page', ['url', 'body', 'etag', 'last_modified'])
 Topic = namedtuple('Topic', ['link', 'id'])
 
 
 class Handler:
 
     def __init__(self, max_connections, connect_timeout, 
-                reconnect_max_attempts, reconnect_delay):
+                reconnect_max_attempts, reconnect_delay,
+                max_total_connections=MAX_TOTAL_CONNECTIONS, dns_cache_ttl=DNS_CACHE_TTL,
+                scheduler=None, max_page_size=MAX_PAGE_SIZE, metrics=None):
         self.max_connections = max_connections
-        self.connect_timeout = aiohttp.ClientTimeout(total=connect_timeout)
+        self.max_total_connections = max_total_connections
+        self.dns_cache_ttl = dns_cache_ttl
+        # waiting for a free pooled connection is not a timeout of the site
+        self.connect_timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=connect_timeout
+        )
         self.reconnect_max_attempts = reconnect_max_attempts
         self.reconnect_delay = reconnect_delay
-        self.semaphores = {}
-
-    async def fetch(self, url, session):
-        async with session.get(url) as response:
+        self.max_page_size = max_page_size
+        self.metrics = metrics or CrawlMetrics()
+        self.session = None
+        self.scheduler = scheduler or Scheduler(max_total_connections, max_connections)
+
+    async def fetch(self, url, session, headers=None):
+        async with session.get(url, headers=headers) as response:
+            if is_busy_status(response.status):
+                raise ServerBusy(response.status, get_retry_after(response.headers))
+            if response.status == NOT_MODIFIED:
+                self.metrics.count('not_modified')
+                return Page(url, None, *get_validators(response.headers))
+            # leaving without reading the body closes the connection
+            error = self.get_rejection(response)
+            if error is None:
+                body = await self.read_body(response)
+                if body is not None:
+                    self.metrics.count('pages')
+                    self.metrics.count('bytes', body.length)
+                    return Page(url, body, *get_validators(response.headers))
+                error = 'Too large'
+            self.metrics.count('rejected')
+            logging.info(f'{error}: {url}')
+
+    def get_rejection(self, response):
+        content_type = response.headers.get('Content-Type')
+        if content_type is None:
+            return 'Bad headers'
+        if 'text/html' not in content_type:
+            return 'Not html'
+        if response.content_length is not None and response.content_length > self.max_page_size:
+            return 'Too large'
+        return None
+
+    async def read_body(self, response):
+        # chunks are decompressed as they arrive, so the limit also stops compression bombs
+        body = SpooledBody()
+        try:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                body.write(chunk)
+                if body.length > self.max_page_size:
+                    body.close()
+                    return None
+        except BaseException:
+            # a broken or cancelled transfer must not leak the spooled file
+            body.close()
+            raise
+        return body
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_total_connections,
+                limit_per_host=self.max_connections,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.connect_timeout)
+        return self.session
+
+    async def get_html(self, url, headers=None):
+        session = self.get_session()
+        attempts = 0
+        while True:
             try:
-                if 'text/html' in response.headers['Content-Type']:
-                    html = await response.read()
-                    return Page(url, html)
-                else:
-                    logging.info(f'Not html: {url}')
-                    return
-            except KeyError:
-                logging.info(f'Bad headers: {url}')
+                async with self.scheduler.request(url) as domain:
+                    with self.metrics.measure(domain.host):
+                        return await self.fetch(url, session, headers)
+            except asyncio.TimeoutError:
+                error = 'Connection timeout'
+                self.metrics.count('timeouts')
+            except ServerBusy as e:
+                error = f'Server busy ({e.status})'
+                self.metrics.count('busy')
+            except aiohttp.client_exceptions.ClientConnectorError:
+                logging.info(f'No address associated with hostname: {url}')
+                self.metrics.count('failures')
+                return
+            except aiohttp.ClientError as e:
+                # e.g. ClientPayloadError when the connection breaks in the middle of the body
+                error = f'Client error ({e!r})'
+            if attempts < self.reconnect_max_attempts:
+                attempts += 1
+                self.metrics.count('retries')
+                await asyncio.sleep(self.reconnect_delay)
+                logging.info(f'Reconnect #{attempts}. URL: {url}.')
+            else:
+                logging.info(f'{error}: {url}')
+                self.metrics.count('failures')
                 return
 
-    def get_semaphore(self, url):
-        url_root = url.split('/')[2]
-        if not url_root in self.semaphores:
-            self.semaphores[url_root] = asyncio.Semaphore(self.max_connections)
-        return self.semaphores[url_root]
-
-    async def get_html(self, url):
-        semaphore = self.get_semaphore(url)
-        async with semaphore:
-            async with aiohttp.ClientSession(timeout=self.connect_timeout) as session:
-                attempts = 0
-                while True:
-                    try:
-                        return await self.fetch(url, session)
-                    except asyncio.TimeoutError:
-                        if attempts < self.reconnect_max_attempts:
-                            attempts += 1
-                            await asyncio.sleep(self.reconnect_delay)
-                            logging.info(f'Reconnect #{attempts}. URL: {url}.')
-                        else:
-                            logging.info(f'Connection timeout: {url}')
-                            return
-                    except aiohttp.client_exceptions.ClientConnectorError:
-                        logging.info(f'No address associated with hostname: {url}')
-                        return
-
-    def clear(self):
-        self.semaphores = {}
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
 
-def get_topics(html):
-    soup = BeautifulSoup(html, 'lxml')
-    rows = soup.find_all('tr', class_='athing')
-    for row in rows:
-        a = row.find('a', class_='storylink')
-        if is_link_external(a['href']):
-            yield Topic(a['href'], row['id'])
+def parse_html(html):
+    try:
+        return lxml.html.fromstring(html)
+    except etree.LxmlError:
+        return None
 
 
-def save_page(html, topic_dir, url):
-    page_name = hashlib.md5(url.encode()).hexdigest()
-    path = os.path.join(topic_dir, page_name + '.html')
-    with open(path, 'wb') as fp:
-        fp.write(html)
+def get_topics(html):
+    document = parse_html(html)
+    if document is None:
+        return []
+    topics = []
+    for row in document.xpath(XPATH_TOPIC_ROWS):
+        links = row.xpath(XPATH_STORY_LINK)
+        if links and is_link_external(links[0]):
+            topics.append((links[0], row.get('id')))
+    return topics
 
 
 def get_comments_links(html):
-    soup = BeautifulSoup(html, 'lxml')
-    anchors = soup.find_all('a')
-    for a in anchors:
-        if is_link_external(a['href']):
-            yield a['href']
+    document = parse_html(html)
+    if document is None:
+        return []
+    return normalize_links(link for link in document.xpath(XPATH_LINKS) if is_link_external(link))
+
+
+def normalize_links(links):
+    urls = set()
+    for link in links:
+        # a malformed link, e.g. with a non-numeric port, is skipped alone
+        try:
+            urls.add(normalize_url(link))
+        except ValueError:
+            logging.info(f'Malformed link: {link}')
+    return list(urls)
+
+
+async def parse(executor, func, html):
+    if executor is None:
+        return func(html)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, html)
 
 
 def is_link_external(link):
     return link.startswith('http') and 'ycombinator' not in link
 
 
-async def process_topic(topic, handler, topics_dir):
-    
-    if not os.path.exists(topics_dir):
-        os.makedirs(topics_dir)
+def log_errors(names, results):
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logging.error(f'{name} failed: {result!r}', exc_info=result)
+
+
+async def get_changed_page(url, handler, cache):
+    # the entry is saved by the caller once the page is processed,
+    # so a cycle interrupted halfway processes the page again
+    entry = cache.get(url)
+    page = await handler.get_html(url, get_conditional_headers(entry))
+    if page is None:
+        return None, None
+    if page.body is None:
+        logging.info(f'Not modified: {url}')
+        return None, None
+    digest = page.body.get_digest()
+    if entry is not None and entry.digest == digest:
+        logging.info(f'Not changed: {url}')
+        page.body.close()
+        return None, None
+    return page, CacheEntry(page.etag, page.last_modified, digest)
+
+
+def read_page(page):
+    # only the parsed links are kept, the body is not stored
+    try:
+        return page.body.read()
+    finally:
+        page.body.close()
+
 
-    topic_dir = os.path.join(topics_dir, topic.id)
-    if os.path.exists(topic_dir):
-        logging.info(f'Already parsed: {topic.link}')
+async def fetch_page(url, handler, store, frontier, topic_id):
+    if not frontier.claim(url, topic_id):
+        logging.info(f'Already fetched: {url}')
         return
-
-    topic_page = await handler.get_html(topic.link)
-    if topic_page is None:
+    page = await handler.get_html(url)
+    if page is None:
+        frontier.mark_failed(url)
         return
+    # the store marks the URL fetched once the page is written
+    await store.put(url, topic_id, page.body)
 
-    loop = asyncio.get_running_loop()
 
-    os.makedirs(topic_dir)
-    await loop.run_in_executor(
-        None, 
-        save_page, 
-        topic_page.html, topic_dir, topic_page.url
-    )
+async def fetch_pages(urls, handler, store, frontier, topic_id):
+    # a few fetchers share the links instead of a task per link,
+    # so a large comments page does not flood the loop with tasks
+    pending = iter(urls)
+
+    async def fetcher():
+        for url in pending:
+            await fetch_page(url, handler, store, frontier, topic_id)
+            # already fetched links return without suspending
+            await asyncio.sleep(0)
 
-    link_page = await handler.get_html(COMMENTS_BASE_URL + topic.id)
+    fetchers = min(len(urls), handler.max_total_connections)
+    results = await asyncio.gather(*(fetcher() for _ in range(fetchers)), return_exceptions=True)
+    log_errors([f'Fetcher of topic {topic_id}'] * fetchers, results)
+
+
+async def process_topic(topic, handler, store, frontier, cache, executor):
+
+    frontier.add_topic(topic.id, topic.link)
+
+    try:
+        topic_url = normalize_url(topic.link)
+    except ValueError:
+        logging.info(f'Malformed link: {topic.link}')
+    else:
+        await fetch_page(topic_url, handler, store, frontier, topic.id)
+
+    # parsed topics are checked again, new comments bring new links
+    comments_url = COMMENTS_BASE_URL + topic.id
+    link_page, entry = await get_changed_page(comments_url, handler, cache)
     if link_page is None:
         return
 
-    links_from_comments = list(set(get_comments_links(link_page.html)))
-    tasks = [handler.get_html(link) for link in links_from_comments]
-    for task in asyncio.as_completed(tasks):
-        link_page =  await task
-        if link_page is None:
-            continue
-        await loop.run_in_executor(
-            None,
-            save_page, 
-            link_page.html, topic_dir, link_page.url
-        )
+    links_from_comments = await parse(executor, get_comments_links, read_page(link_page))
+    await fetch_pages(links_from_comments, handler, store, frontier, topic.id)
+    frontier.finish_topic(topic.id)
+    cache.set(comments_url, entry)
 
 
 def get_cmd_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--max_connections', type=int, default=3)
+    parser.add_argument('-l', '--max_total_connections', type=int, default=MAX_TOTAL_CONNECTIONS)
+    parser.add_argument('--dns_cache_ttl', type=int, default=DNS_CACHE_TTL)
     parser.add_argument('-t', '--connect_timeout', type=int, default=10)
     parser.add_argument('-i', '--sleep_interval', type=int, default=60)
     parser.add_argument('-a', '--reconnect_max_attempts', type=int, default=3)
     parser.add_argument('-d', '--reconnect_delay', type=float, default=0.5)
     parser.add_argument('-f', '--topics_dir', type=str, default='')
+    parser.add_argument('-s', '--frontier', type=str, default='')
+    parser.add_argument('-b', '--bloom_capacity', type=int, default=BLOOM_CAPACITY)
+    parser.add_argument('-p', '--parse_workers', type=int, default=PARSE_WORKERS)
+    parser.add_argument('--segment_size', type=int, default=SEGMENT_SIZE)
+    parser.add_argument('--write_queue', type=int, default=WRITE_QUEUE_SIZE)
+    parser.add_argument('-m', '--max_page_size', type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument('-r', '--domain_rate', type=float, default=DOMAIN_RATE)
+    parser.add_argument('--domain_burst', type=int, default=DOMAIN_BURST)
+    parser.add_argument('--crawl_delay', type=float, default=CRAWL_DELAY)
+    parser.add_argument('--metrics_interval', type=float, default=METRICS_INTERVAL)
+    parser.add_argument('--metrics_file', type=str, default='')
+    parser.add_argument('--metrics_port', type=int, default=0)
     return parser.parse_args()
 
 
-async def worker(handler, topics_dir):
+def get_gauges(handler, store, frontier):
+    return {
+        'in_flight': handler.scheduler.in_flight,
+        'waiting': handler.scheduler.get_waiting(),
+        'domains': len(handler.scheduler.domains),
+        'write_queue': store.queue.qsize(),
+        'stored': store.stored,
+        'deduplicated': store.deduplicated,
+        **frontier.get_stats()
+    }
+
+
+def get_resumed_topics(frontier, topics):
+    topic_ids = {topic.id for topic in topics}
+    return [
+        Topic(link, topic_id) for link, topic_id in frontier.get_unfinished_topics()
+        if topic_id not in topic_ids
+    ]
+
+
+async def worker(handler, store, frontier, cache, executor=None, lag_monitor=None):
     logging.info('Started.')
-    main_page = await handler.get_html(BASE_URL)
-    topics = get_topics(main_page.html)
-    tasks = [process_topic(topic, handler, topics_dir) for topic in topics]
-    await asyncio.wait(tasks)
+    main_page, entry = await get_changed_page(BASE_URL, handler, cache)
+    topics = []
+    if main_page is not None:
+        topics = [Topic(*topic) for topic in await parse(executor, get_topics, read_page(main_page))]
+    topics += get_resumed_topics(frontier, topics)
+    results = await asyncio.gather(*(
+        process_topic(topic, handler, store, frontier, cache, executor) for topic in topics
+    ), return_exceptions=True)
+    log_errors((f'Topic {topic.id}' for topic in topics), results)
+    if main_page is not None:
+        cache.set(BASE_URL, entry)
     logging.info('Finished.')
+    if lag_monitor is not None:
+        lag_monitor.report()
 
 
 async def main():
@@ -166,17 +347,53 @@ async def main():
         datefmt='%Y.%m.%d %H:%M:%S'
     )
 
+    scheduler = Scheduler(
+        args.max_total_connections, args.max_connections,
+        args.domain_rate, args.domain_burst, args.crawl_delay
+    )
+    metrics = CrawlMetrics()
     handler = Handler(args.max_connections, args.connect_timeout, 
-        args.reconnect_max_attempts, args.reconnect_delay)
+        args.reconnect_max_attempts, args.reconnect_delay,
+        args.max_total_connections, args.dns_cache_ttl, scheduler, args.max_page_size, metrics)
+
+    os.makedirs(args.topics_dir or '.', exist_ok=True)
+    frontier = Frontier(
+        args.frontier or os.path.join(args.topics_dir, FRONTIER_NAME),
+        args.bloom_capacity
+    )
+    store = PageStore(args.topics_dir or '.', args.segment_size, args.write_queue, frontier.mark_fetched)
+    store.start()
+    cache = PageCache(os.path.join(args.topics_dir, CACHE_NAME))
+    executor = None
+    if args.parse_workers > 0:
+        executor = concurrent.futures.ProcessPoolExecutor(args.parse_workers)
+    lag_monitor = LagMonitor(metrics=metrics)
+    lag_monitor.start()
+    reporter = MetricsReporter(
+        metrics, lambda: get_gauges(handler, store, frontier),
+        args.metrics_interval, args.metrics_file, args.metrics_port
+    )
+    await reporter.start()
 
+    cycle = None
     try:
         while True:
-            asyncio.create_task(worker(handler, args.topics_dir))
+            if cycle is None or cycle.done():
+                cycle = asyncio.create_task(worker(handler, store, frontier, cache, executor, lag_monitor))
+            else:
+                logging.info('Previous cycle is still running.')
             await asyncio.sleep(args.sleep_interval)
-            if len(asyncio.all_tasks()) == 1:
-                handler.clear()
     except Exception as e:
         logging.exception(f'Unexpected error: {e}')
+    finally:
+        lag_monitor.stop()
+        await reporter.stop()
+        await handler.close()
+        await store.close()
+        frontier.close()
+        cache.close()
+        if executor is not None:
+            executor.shutdown()
 
 
 if __name__ == '__main__':
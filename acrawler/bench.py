@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+import json
+import socket
+import time
+import aiohttp
+from multiprocessing import Process
+from aiohttp import web
+from acrawler import Handler
+from scheduler import Scheduler
+
+
+STUB_HOST = 'localhost'
+
+
+class SessionPerUrlHandler(Handler):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.semaphores = {}
+
+    def get_semaphore(self, url):
+        url_root = url.split('/')[2]
+        if url_root not in self.semaphores:
+            self.semaphores[url_root] = asyncio.Semaphore(self.max_connections)
+        return self.semaphores[url_root]
+
+    async def get_html(self, url):
+        async with self.get_semaphore(url):
+            async with aiohttp.ClientSession(timeout=self.connect_timeout) as session:
+                return await self.fetch(url, session)
+
+
+HANDLERS = {
+    'per_url': SessionPerUrlHandler,
+    'shared': Handler
+}
+
+
+def run_stub(port, page_size, delay):
+    body = b'<html><body>' + b'x' * page_size + b'</body></html>'
+
+    async def page(request):
+        if delay:
+            await asyncio.sleep(delay)
+        return web.Response(body=body, content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/{name}', page)
+    web.run_app(app, host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+def start_stub(port, page_size, delay):
+    process = Process(target=run_stub, args=(port, page_size, delay), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+    raise RuntimeError('Stub server did not start')
+
+
+async def crawl(handler_class, urls, max_connections):
+    # no politeness limits, the stub is local
+    scheduler = Scheduler(len(urls), max_connections, rate=0)
+    handler = handler_class(max_connections, 10, 0, 0, scheduler=scheduler)
+    started = time.perf_counter()
+    pages = await asyncio.gather(*(handler.get_html(url) for url in urls))
+    elapsed = time.perf_counter() - started
+    await handler.close()
+    fetched = sum(page is not None for page in pages)
+    return {'pages': fetched, 'seconds': round(elapsed, 3), 'pages_per_sec': round(fetched / elapsed, 1)}
+
+
+def get_cmd_args():
+    parser = argparse.ArgumentParser(description='Fetches pages of a local stub server, prints JSON lines')
+    parser.add_argument('-n', '--pages', type=int, default=2000)
+    parser.add_argument('-c', '--max_connections', type=int, default=10, help='Connections per host')
+    parser.add_argument('-p', '--port', type=int, default=8081)
+    parser.add_argument('-s', '--page_size', type=int, default=20000, help='Page size in bytes')
+    parser.add_argument('-d', '--delay', type=float, default=0, help='Stub response delay in seconds')
+    parser.add_argument('-m', '--mode', choices=[*HANDLERS, 'both'], default='both')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = get_cmd_args()
+    stub = start_stub(args.port, args.page_size, args.delay)
+    urls = [f'http://{STUB_HOST}:{args.port}/{i}' for i in range(args.pages)]
+    modes = list(HANDLERS) if args.mode == 'both' else [args.mode]
+    try:
+        for mode in modes:
+            result = asyncio.run(crawl(HANDLERS[mode], urls, args.max_connections))
+            print(json.dumps({'mode': mode, 'max_connections': args.max_connections, **result}))
+    finally:
+        stub.terminate()
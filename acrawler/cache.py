@@ -0,0 +1,53 @@
+import sqlite3
+from collections import namedtuple
+
+
+NOT_MODIFIED = 304
+
+CacheEntry = namedtuple('CacheEntry', ['etag', 'last_modified', 'digest'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    digest TEXT NOT NULL
+);
+'''
+
+
+def get_validators(headers):
+    return headers.get('ETag'), headers.get('Last-Modified')
+
+
+def get_conditional_headers(entry):
+    headers = {}
+    if entry is None:
+        return headers
+    if entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+class PageCache:
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def get(self, url):
+        row = self.db.execute(
+            'SELECT etag, last_modified, digest FROM pages WHERE url = ?', (url,)
+        ).fetchone()
+        return CacheEntry(*row) if row is not None else None
+
+    def set(self, url, entry):
+        self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', (url, *entry))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
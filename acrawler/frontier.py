@@ -0,0 +1,137 @@
+import math
+import sqlite3
+from urllib.parse import urlsplit, urlunsplit
+
+
+BLOOM_CAPACITY = 1000000
+BLOOM_ERROR_RATE = 0.01
+COMMIT_EVERY = 100
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+PENDING, FETCHED, FAILED = 0, 1, 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    topic_id TEXT,
+    state INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    id TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    netloc = host
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{host}:{parts.port}'
+    if parts.username:
+        netloc = f'{parts.username}@{netloc}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class BloomFilter:
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def get_positions(self, item):
+        # the filter is rebuilt from the database on start, so the salted
+        # str hash, cached on the string itself, is stable enough
+        h = hash(item)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for position in self.get_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        for position in self.get_positions(item):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class Frontier:
+
+    def __init__(self, path, bloom_capacity=BLOOM_CAPACITY):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        # URLs claimed but never fetched belong to unfinished topics and are claimed again on resume
+        self.db.execute('DELETE FROM urls WHERE state = ?', (PENDING,))
+        self.db.commit()
+        self.counts = dict.fromkeys((PENDING, FETCHED, FAILED), 0)
+        self.counts.update(self.db.execute('SELECT state, count(*) FROM urls GROUP BY state'))
+        self.seen = BloomFilter(max(bloom_capacity, 2 * sum(self.counts.values())))
+        for url, in self.db.execute('SELECT url FROM urls'):
+            self.seen.add(url)
+        self.writes = 0
+
+    def write(self, query, params):
+        cursor = self.db.execute(query, params)
+        self.writes += 1
+        if self.writes >= COMMIT_EVERY:
+            self.commit()
+        return cursor
+
+    def commit(self):
+        self.db.commit()
+        self.writes = 0
+
+    def is_seen(self, url):
+        if url not in self.seen:
+            return False
+        return self.db.execute('SELECT 1 FROM urls WHERE url = ?', (url,)).fetchone() is not None
+
+    def claim(self, url, topic_id=None):
+        if self.is_seen(url):
+            return False
+        self.seen.add(url)
+        self.write('INSERT INTO urls (url, topic_id, state) VALUES (?, ?, ?)', (url, topic_id, PENDING))
+        self.counts[PENDING] += 1
+        return True
+
+    def set_state(self, url, state):
+        self.write('UPDATE urls SET state = ? WHERE url = ?', (state, url))
+        self.counts[PENDING] -= 1
+        self.counts[state] += 1
+
+    def mark_fetched(self, url):
+        self.set_state(url, FETCHED)
+
+    def mark_failed(self, url):
+        self.set_state(url, FAILED)
+
+    def add_topic(self, topic_id, link):
+        self.write('INSERT OR IGNORE INTO topics (id, link) VALUES (?, ?)', (topic_id, link))
+
+    def finish_topic(self, topic_id):
+        self.write('UPDATE topics SET done = 1 WHERE id = ?', (topic_id,))
+        self.commit()
+
+    def get_stats(self):
+        return {
+            'frontier_urls': sum(self.counts.values()),
+            'frontier_pending': self.counts[PENDING],
+            'frontier_fetched': self.counts[FETCHED],
+            'frontier_failed': self.counts[FAILED]
+        }
+
+    def get_unfinished_topics(self):
+        return self.db.execute('SELECT link, id FROM topics WHERE done = 0').fetchall()
+
+    def close(self):
+        self.commit()
+        self.db.close()
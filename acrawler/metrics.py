@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import logging
+import contextlib
+from bisect import bisect_left
+from aiohttp import web
+
+
+METRICS_INTERVAL = 10
+METRICS_HOST = '127.0.0.1'
+METRICS_PATH = '/metrics'
+LAG_INTERVAL = 0.05
+LAG_THRESHOLD = 0.5
+TOP_DOMAINS = 20
+COUNTERS = ('pages', 'bytes', 'not_modified', 'rejected', 'timeouts', 'busy', 'retries', 'failures')
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'sum': round(self.sum, 6), 'buckets': buckets}
+
+
+class CrawlMetrics:
+
+    def __init__(self):
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.domains = {}
+        self.lag = Histogram(LAG_BUCKETS)
+        self.max_lag = 0.0
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        self.totals[name] += value
+
+    def observe_latency(self, host, seconds):
+        histogram = self.domains.get(host)
+        if histogram is None:
+            histogram = self.domains[host] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def measure(self, host):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe_latency(host, time.monotonic() - started)
+
+    def observe_lag(self, lag):
+        self.lag.observe(lag)
+        self.max_lag = max(self.max_lag, lag)
+
+    def get_top_domains(self):
+        # only the busiest domains, a crawl of comment links touches thousands of them
+        domains = sorted(self.domains.items(), key=lambda item: item[1].count, reverse=True)
+        return {host: histogram.to_dict() for host, histogram in domains[:TOP_DOMAINS]}
+
+    def snapshot(self, gauges):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        snapshot = {
+            'time': round(time.time(), 3),
+            'interval': round(elapsed, 3),
+            'pages_per_sec': round(self.counters['pages'] / elapsed, 2),
+            'bytes_per_sec': round(self.counters['bytes'] / elapsed, 1),
+            'counters': self.counters,
+            'totals': dict(self.totals),
+            'gauges': gauges,
+            'loop_lag': {**self.lag.to_dict(), 'max': round(self.max_lag, 6)},
+            'domains': self.get_top_domains()
+        }
+        self.reset()
+        return snapshot
+
+
+class LagMonitor:
+
+    def __init__(self, interval=LAG_INTERVAL, threshold=LAG_THRESHOLD, metrics=None):
+        self.interval = interval
+        self.threshold = threshold
+        self.metrics = metrics
+        self.lags = []
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self.lags.append(lag)
+            if self.metrics is not None:
+                self.metrics.observe_lag(lag)
+            if lag > self.threshold:
+                logging.warning(f'Event loop was blocked for {lag * 1000:.0f} ms.')
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def report(self):
+        lags, self.lags = sorted(self.lags), []
+        if not lags:
+            return
+        p50, p99 = lags[len(lags) // 2], lags[int(len(lags) * 0.99)]
+        logging.info(
+            f'Event loop lag: p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms, '
+            f'max {lags[-1] * 1000:.1f} ms.'
+        )
+
+
+class MetricsReporter:
+
+    def __init__(self, metrics, get_gauges, interval=METRICS_INTERVAL, path=None, port=None):
+        self.metrics = metrics
+        self.get_gauges = get_gauges
+        self.interval = interval
+        self.path = path
+        self.port = port
+        self.last = {}
+        self.task = None
+        self.runner = None
+
+    async def start(self):
+        if self.port:
+            app = web.Application()
+            app.router.add_get(METRICS_PATH, self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, METRICS_HOST, self.port).start()
+        self.task = asyncio.create_task(self.run())
+
+    async def handle(self, request):
+        return web.json_response(self.last)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.last = self.metrics.snapshot(self.get_gauges())
+            if self.path:
+                self.write(self.last)
+
+    def write(self, snapshot):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(snapshot) + '\n')
+        except OSError as e:
+            logging.error(f'Failed to write metrics: {e}')
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,210 @@
+import asyncio
+import contextlib
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+
+DOMAIN_RATE = 2.0
+DOMAIN_BURST = 4
+CRAWL_DELAY = 0
+BACKOFF_DELAY = 1.0
+MAX_RETRY_AFTER = 300
+DOMAIN_IDLE_TTL = 300
+
+SUCCESS, FAILURE, BACKOFF = 0, 1, 2
+
+
+class ServerBusy(Exception):
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+        self.retry_after = retry_after
+
+
+def is_busy_status(status):
+    return status == 429 or status >= 500
+
+
+def get_retry_after(headers):
+    value = headers.get('Retry-After', '').strip()
+    if not value.isdigit():
+        return None
+    return min(int(value), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def get_delay(self, now):
+        if not self.rate:
+            return 0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+
+class Domain:
+
+    def __init__(self, host, max_concurrency, rate, burst, crawl_delay, now):
+        self.host = host
+        self.max_concurrency = max_concurrency
+        # the AIMD window starts at one request and grows while the site keeps up
+        self.concurrency = 1.0
+        self.bucket = TokenBucket(rate, burst, now)
+        self.crawl_delay = crawl_delay
+        self.not_before = now
+        self.in_flight = 0
+        self.waiters = deque()
+        self.last_active = now
+
+    def get_delay(self, now):
+        # None means the domain waits for one of its requests to finish
+        if self.in_flight >= int(self.concurrency):
+            return None
+        return max(self.not_before - now, self.bucket.get_delay(now))
+
+    def start(self, now):
+        self.bucket.take()
+        self.in_flight += 1
+        self.not_before = now + self.crawl_delay
+        self.last_active = now
+
+    def finish(self, now, outcome, retry_after=None):
+        self.in_flight -= 1
+        self.last_active = now
+        if outcome == SUCCESS:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        elif outcome == BACKOFF:
+            self.concurrency = max(1.0, self.concurrency / 2)
+            self.not_before = max(self.not_before, now + (retry_after or BACKOFF_DELAY))
+
+    def is_idle(self, now):
+        return not self.in_flight and not self.waiters and now - self.last_active > DOMAIN_IDLE_TTL
+
+
+class Scheduler:
+
+    def __init__(self, max_in_flight, max_per_domain, rate=DOMAIN_RATE, burst=DOMAIN_BURST,
+                 crawl_delay=CRAWL_DELAY):
+        self.max_in_flight = max_in_flight
+        self.max_per_domain = max_per_domain
+        self.rate = rate
+        self.burst = burst
+        self.crawl_delay = crawl_delay
+        self.domains = {}
+        # domains with waiting requests, the least recently served first
+        self.ready = OrderedDict()
+        self.in_flight = 0
+        self.timer = None
+        self.purged_at = 0
+
+    def get_waiting(self):
+        return sum(len(domain.waiters) for domain in self.ready.values())
+
+    def get_domain(self, url, now):
+        host = urlsplit(url).hostname or ''
+        domain = self.domains.get(host)
+        if domain is None:
+            domain = Domain(host, self.max_per_domain, self.rate, self.burst, self.crawl_delay, now)
+            self.domains[host] = domain
+        return domain
+
+    async def acquire(self, url):
+        loop = asyncio.get_running_loop()
+        domain = self.get_domain(url, loop.time())
+        waiter = loop.create_future()
+        domain.waiters.append(waiter)
+        self.ready.setdefault(domain.host, domain)
+        self.dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(domain, FAILURE)
+            raise
+        return domain
+
+    def release(self, domain, outcome, retry_after=None):
+        self.in_flight -= 1
+        domain.finish(asyncio.get_running_loop().time(), outcome, retry_after)
+        self.dispatch()
+
+    @contextlib.asynccontextmanager
+    async def request(self, url):
+        domain = await self.acquire(url)
+        outcome, retry_after = FAILURE, None
+        try:
+            yield domain
+            outcome = SUCCESS
+        except asyncio.TimeoutError:
+            outcome = BACKOFF
+            raise
+        except ServerBusy as e:
+            outcome, retry_after = BACKOFF, e.retry_after
+            raise
+        finally:
+            self.release(domain, outcome, retry_after)
+
+    def get_next_waiter(self, domain):
+        while domain.waiters and domain.waiters[0].done():
+            domain.waiters.popleft()
+        return domain.waiters[0] if domain.waiters else None
+
+    def dispatch(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        wake_in = None
+        granted = True
+        # every pass serves each domain at most once, so a domain with
+        # a long queue cannot take the global slots from the others
+        while granted and self.in_flight < self.max_in_flight:
+            granted = False
+            for domain in list(self.ready.values()):
+                if self.in_flight >= self.max_in_flight:
+                    break
+                waiter = self.get_next_waiter(domain)
+                if waiter is None:
+                    del self.ready[domain.host]
+                    continue
+                delay = domain.get_delay(now)
+                if delay is None:
+                    continue
+                if delay > 0:
+                    wake_in = delay if wake_in is None else min(wake_in, delay)
+                    continue
+                domain.start(now)
+                domain.waiters.popleft().set_result(None)
+                self.in_flight += 1
+                self.ready.move_to_end(domain.host)
+                granted = True
+        if wake_in is not None:
+            self.set_timer(loop, now + wake_in)
+        self.purge(now)
+
+    def set_timer(self, loop, when):
+        if self.timer is not None:
+            if self.timer.when() <= when:
+                return
+            self.timer.cancel()
+        self.timer = loop.call_at(when, self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        self.dispatch()
+
+    def purge(self, now):
+        if now - self.purged_at < DOMAIN_IDLE_TTL:
+            return
+        self.purged_at = now
+        for host in [host for host, domain in self.domains.items() if domain.is_idle(now)]:
+            del self.domains[host]
@@ -0,0 +1,299 @@
+import os
+import re
+import gzip
+import time
+import zlib
+import uuid
+import base64
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import functools
+import concurrent.futures
+from collections import namedtuple
+from email.utils import formatdate
+
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+WRITE_QUEUE_SIZE = 1000
+WRITE_BATCH_SIZE = 100
+SPILLED_QUEUE_SIZE = 100
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 256 * 1024
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+SEGMENT_NAME = 'pages-{:05d}.warc.gz'
+INDEX_NAME = 'index.sqlite3'
+RECORD_TERMINATOR = b'\r\n\r\n'
+REGEXP_SEGMENT = re.compile(r'pages-(\d{5})\.warc\.gz$')
+
+Record = namedtuple('Record', ['url', 'topic_id', 'body', 'fetched_at'])
+Location = namedtuple('Location', ['segment', 'offset', 'length'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contents (
+    digest TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    topic_id TEXT,
+    digest TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+'''
+
+
+class SpooledBody:
+
+    def __init__(self, spool_size=SPOOL_SIZE):
+        # small bodies stay in memory, larger ones are spilled to a temporary file
+        self.file = tempfile.SpooledTemporaryFile(spool_size)
+        self.sha1 = hashlib.sha1()
+        self.length = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.sha1.update(chunk)
+        self.length += len(chunk)
+
+    def get_digest(self):
+        return 'sha1:' + base64.b32encode(self.sha1.digest()).decode()
+
+    def iter_chunks(self):
+        self.file.seek(0)
+        return iter(functools.partial(self.file.read, CHUNK_SIZE), b'')
+
+    @property
+    def spilled(self):
+        return self.file._rolled
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+def compress_record(record, digest):
+    header = (
+        'WARC/1.0\r\n'
+        'WARC-Type: resource\r\n'
+        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+        f'WARC-Target-URI: {record.url}\r\n'
+        f'WARC-Date: {formatdate(record.fetched_at, usegmt=True)}\r\n'
+        f'WARC-Block-Digest: {digest}\r\n'
+        'Content-Type: text/html\r\n'
+        f'Content-Length: {record.body.length}\r\n\r\n'
+    )
+    # every record is a separate gzip member, so it can be read by its offset
+    compressor = zlib.compressobj(wbits=GZIP_WBITS)
+    yield compressor.compress(header.encode())
+    for chunk in record.body.iter_chunks():
+        yield compressor.compress(chunk)
+    yield compressor.compress(RECORD_TERMINATOR) + compressor.flush()
+
+
+def parse_record(data):
+    block = gzip.decompress(data)
+    header_end = block.index(RECORD_TERMINATOR) + len(RECORD_TERMINATOR)
+    return block[header_end:-len(RECORD_TERMINATOR)]
+
+
+class SegmentWriter:
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        # a new run never appends to a segment that may end with a partial record
+        self.number = self.get_last_number()
+        self.name = None
+        self.file = None
+
+    def get_last_number(self):
+        numbers = [
+            int(match.group(1)) for match in map(REGEXP_SEGMENT.match, os.listdir(self.directory))
+            if match is not None
+        ]
+        return max(numbers, default=0)
+
+    def rotate(self):
+        self.close()
+        self.number += 1
+        self.name = SEGMENT_NAME.format(self.number)
+        self.file = open(os.path.join(self.directory, self.name), 'ab')
+
+    def append(self, chunks):
+        if self.file is None or self.file.tell() >= self.segment_size:
+            self.rotate()
+        offset = self.file.tell()
+        for chunk in chunks:
+            self.file.write(chunk)
+        return Location(self.name, offset, self.file.tell() - offset)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class PageIndex:
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def get_location(self, digest):
+        row = self.db.execute(
+            'SELECT segment, offset, length FROM contents WHERE digest = ?', (digest,)
+        ).fetchone()
+        return Location(*row) if row is not None else None
+
+    def add_content(self, digest, location):
+        self.db.execute('INSERT INTO contents VALUES (?, ?, ?, ?)', (digest, *location))
+
+    def add_page(self, record, digest):
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)',
+            (record.url, record.topic_id, digest, record.fetched_at)
+        )
+
+    def find(self, url):
+        row = self.db.execute(
+            'SELECT segment, offset, length FROM pages JOIN contents USING (digest) WHERE url = ?',
+            (url,)
+        ).fetchone()
+        return Location(*row) if row is not None else None
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class PageStore:
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, queue_size=WRITE_QUEUE_SIZE,
+                 on_stored=None, spilled_size=SPILLED_QUEUE_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segments = SegmentWriter(directory, segment_size)
+        self.index = PageIndex(os.path.join(directory, INDEX_NAME))
+        self.queue = asyncio.Queue(queue_size)
+        # every spilled body keeps its temporary file open until it is written
+        self.spilled = asyncio.Semaphore(spilled_size)
+        # the index connection and the open segment belong to this one thread
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.on_stored = on_stored
+        self.writer_task = None
+        self.stored = 0
+        self.deduplicated = 0
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self.write_forever())
+
+    async def put(self, url, topic_id, body):
+        acquired = False
+        try:
+            if body.spilled:
+                await self.spilled.acquire()
+                acquired = True
+            await self.queue.put(Record(url, topic_id, body, time.time()))
+        except BaseException:
+            if acquired:
+                self.spilled.release()
+            body.close()
+            raise
+
+    def release_spilled(self, records):
+        for record in records:
+            if record.body.spilled:
+                self.spilled.release()
+
+    async def get_batch(self):
+        batch = [await self.queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def write_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.get_batch()
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    await loop.run_in_executor(self.executor, self.write_batch, records)
+                except (OSError, sqlite3.Error) as e:
+                    logging.error(f'Failed to store {len(records)} pages: {e}')
+                else:
+                    self.notify(records)
+                self.release_spilled(records)
+            if len(records) < len(batch):
+                return
+
+    def notify(self, records):
+        if self.on_stored is not None:
+            for record in records:
+                self.on_stored(record.url)
+
+    def write_batch(self, records):
+        stored = 0
+        try:
+            for record in records:
+                digest = record.body.get_digest()
+                if self.index.get_location(digest) is None:
+                    location = self.segments.append(compress_record(record, digest))
+                    self.index.add_content(digest, location)
+                    stored += 1
+                self.index.add_page(record, digest)
+            self.segments.flush()
+            self.index.commit()
+        except BaseException:
+            # the whole batch stays pending in the frontier, so none of it is indexed
+            self.index.rollback()
+            raise
+        finally:
+            for record in records:
+                record.body.close()
+        self.stored += stored
+        self.deduplicated += len(records) - stored
+
+    def read_page(self, url):
+        location = self.index.find(url)
+        if location is None:
+            return None
+        with open(os.path.join(self.directory, location.segment), 'rb') as f:
+            f.seek(location.offset)
+            return parse_record(f.read(location.length))
+
+    async def read(self, url):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.read_page, url)
+
+    def close_files(self):
+        self.segments.close()
+        self.index.close()
+
+    async def close(self):
+        if self.writer_task is not None:
+            await self.queue.put(None)
+            await self.writer_task
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.close_files)
+        self.executor.shutdown()
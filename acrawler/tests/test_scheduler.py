@@ -0,0 +1,201 @@
+import asyncio
+import unittest
+from scheduler import Scheduler, Domain, TokenBucket, ServerBusy, is_busy_status, get_retry_after
+from scheduler import SUCCESS, BACKOFF, FAILURE, BACKOFF_DELAY
+
+
+async def hold(scheduler, url, served, release):
+    async with scheduler.request(url) as domain:
+        served.append(domain.host)
+        await release.wait()
+
+
+async def busy(scheduler, url, status, retry_after=None):
+    try:
+        async with scheduler.request(url):
+            raise ServerBusy(status, retry_after)
+    except ServerBusy:
+        pass
+
+
+class TestBusyStatus(unittest.TestCase):
+
+    def test_statuses(self):
+        self.assertTrue(is_busy_status(429))
+        self.assertTrue(is_busy_status(503))
+        self.assertFalse(is_busy_status(404))
+        self.assertFalse(is_busy_status(200))
+
+    def test_retry_after(self):
+        self.assertEqual(get_retry_after({'Retry-After': ' 7 '}), 7)
+        self.assertEqual(get_retry_after({'Retry-After': '100000'}), 300)
+        self.assertIsNone(get_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}))
+        self.assertIsNone(get_retry_after({}))
+
+
+class TestDomain(unittest.TestCase):
+
+    def test_window_grows_to_limit(self):
+        domain = Domain('a', 4, 0, 1, 0, 0)
+        windows = []
+        for _ in range(20):
+            domain.in_flight += 1
+            domain.finish(0, SUCCESS)
+            windows.append(domain.concurrency)
+        self.assertEqual(windows[:3], [2.0, 2.5, 2.9])
+        self.assertEqual(windows[-1], 4)
+        self.assertEqual(windows, sorted(windows))
+
+    def test_backoff_halves_window(self):
+        domain = Domain('a', 8, 0, 1, 0, 0)
+        domain.concurrency = 6.0
+        domain.in_flight = 1
+        domain.finish(10, BACKOFF)
+        self.assertEqual(domain.concurrency, 3.0)
+        self.assertEqual(domain.not_before, 10 + BACKOFF_DELAY)
+        for _ in range(3):
+            domain.in_flight = 1
+            domain.finish(10, BACKOFF, retry_after=30)
+        self.assertEqual(domain.concurrency, 1.0)
+        self.assertEqual(domain.not_before, 40)
+
+    def test_failure_keeps_window(self):
+        domain = Domain('a', 8, 0, 1, 0, 0)
+        domain.concurrency = 3.0
+        domain.in_flight = 1
+        domain.finish(0, FAILURE)
+        self.assertEqual(domain.concurrency, 3.0)
+        self.assertEqual(domain.not_before, 0)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        bucket = TokenBucket(2, 2, 0)
+        for _ in range(2):
+            self.assertEqual(bucket.get_delay(0), 0)
+            bucket.take()
+        self.assertEqual(bucket.get_delay(0), 0.5)
+        self.assertEqual(bucket.get_delay(0.25), 0.25)
+        self.assertEqual(bucket.get_delay(0.5), 0)
+
+    def test_burst_is_capped(self):
+        bucket = TokenBucket(2, 2, 0)
+        bucket.get_delay(100)
+        self.assertEqual(bucket.tokens, 2)
+
+    def test_no_rate(self):
+        bucket = TokenBucket(0, 1, 0)
+        for _ in range(10):
+            bucket.take()
+        self.assertEqual(bucket.get_delay(0), 0)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_backoff_and_recovery(self):
+        async def run():
+            scheduler = Scheduler(10, 8, rate=0)
+            domain = scheduler.get_domain('http://a.com/', 0)
+            domain.concurrency = 8.0
+            for status, window in ((429, 4.0), (503, 2.0)):
+                await busy(scheduler, 'http://a.com/', status)
+                self.assertEqual(domain.concurrency, window)
+                # the domain is paused for a while after an overload signal
+                domain.not_before = 0
+            for _ in range(30):
+                async with scheduler.request('http://a.com/'):
+                    pass
+            self.assertEqual(domain.concurrency, 8)
+            await busy(scheduler, 'http://a.com/', 429, retry_after=5)
+            loop = asyncio.get_running_loop()
+            self.assertGreater(domain.not_before, loop.time() + 4)
+            self.assertEqual(scheduler.in_flight, 0)
+        asyncio.run(run())
+
+    def test_timeout_backs_off(self):
+        async def run():
+            scheduler = Scheduler(10, 8, rate=0)
+            domain = scheduler.get_domain('http://a.com/', 0)
+            domain.concurrency = 4.0
+            with self.assertRaises(asyncio.TimeoutError):
+                async with scheduler.request('http://a.com/'):
+                    raise asyncio.TimeoutError
+            self.assertEqual(domain.concurrency, 2.0)
+        asyncio.run(run())
+
+    def test_round_robin(self):
+        async def run():
+            scheduler = Scheduler(1, 8, rate=0)
+            served = []
+            release = asyncio.Event()
+            release.set()
+            blocker = asyncio.Event()
+            blocker_task = asyncio.create_task(hold(scheduler, 'http://z.com/', [], blocker))
+            await asyncio.sleep(0)
+            urls = ['http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+                    'http://b.com/1', 'http://b.com/2', 'http://c.com/1']
+            tasks = [asyncio.create_task(hold(scheduler, url, served, release)) for url in urls]
+            await asyncio.sleep(0)
+            self.assertEqual(scheduler.get_waiting(), len(urls))
+            blocker.set()
+            await asyncio.gather(blocker_task, *tasks)
+            # a domain with a long queue does not get ahead of the others
+            self.assertEqual(served, ['a.com', 'b.com', 'c.com', 'a.com', 'b.com', 'a.com'])
+        asyncio.run(run())
+
+    def test_global_cap(self):
+        async def run():
+            scheduler = Scheduler(3, 8, rate=0)
+            served = []
+            release = asyncio.Event()
+            tasks = [
+                asyncio.create_task(hold(scheduler, f'http://{host}.com/', served, release))
+                for host in 'abcde'
+            ]
+            await asyncio.sleep(0.01)
+            self.assertEqual(served, ['a.com', 'b.com', 'c.com'])
+            self.assertEqual(scheduler.in_flight, 3)
+            self.assertEqual(scheduler.get_waiting(), 2)
+            release.set()
+            await asyncio.gather(*tasks)
+            self.assertEqual(len(served), 5)
+            self.assertEqual(scheduler.in_flight, 0)
+        asyncio.run(run())
+
+    def test_per_domain_window(self):
+        async def run():
+            scheduler = Scheduler(10, 8, rate=0)
+            served = []
+            release = asyncio.Event()
+            tasks = [
+                asyncio.create_task(hold(scheduler, f'http://a.com/{i}', served, release))
+                for i in range(3)
+            ]
+            await asyncio.sleep(0.01)
+            # a new domain starts with a window of one request
+            self.assertEqual(len(served), 1)
+            release.set()
+            await asyncio.gather(*tasks)
+        asyncio.run(run())
+
+    def test_domain_rate(self):
+        async def run():
+            rate = 20
+            scheduler = Scheduler(10, 8, rate=rate, burst=1)
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for i in range(5):
+                async with scheduler.request(f'http://a.com/{i}'):
+                    pass
+            # the first request uses the burst, the other four wait for tokens
+            self.assertGreaterEqual(loop.time() - started, 4 / rate * 0.9)
+            started = loop.time()
+            async with scheduler.request('http://b.com/'):
+                pass
+            self.assertLess(loop.time() - started, 1 / rate)
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import asyncio
+import hashlib
+import base64
+import tempfile
+import unittest
+from storage import PageStore, SpooledBody, SegmentWriter, SEGMENT_NAME, REGEXP_SEGMENT
+
+
+def make_body(content, spool_size=1024):
+    body = SpooledBody(spool_size)
+    for i in range(0, len(content), 100):
+        body.write(content[i:i + 100])
+    return body
+
+
+def list_segments(directory):
+    return sorted(filter(REGEXP_SEGMENT.match, os.listdir(directory)))
+
+
+class TestSpooledBody(unittest.TestCase):
+
+    def test_digest(self):
+        content = os.urandom(5000)
+        body = make_body(content)
+        expected = 'sha1:' + base64.b32encode(hashlib.sha1(content).digest()).decode()
+        self.assertEqual(body.get_digest(), expected)
+        self.assertEqual(body.length, len(content))
+        # a body larger than the spool is moved to a file and reads back whole
+        self.assertTrue(body.file._rolled)
+        self.assertEqual(body.read(), content)
+        self.assertEqual(b''.join(body.iter_chunks()), content)
+        body.close()
+
+
+class TestPageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def store_pages(self, pages, segment_size=1024 * 1024):
+        stored = []
+        store = PageStore(self.directory, segment_size, on_stored=stored.append)
+        store.start()
+        for url, content in pages:
+            await store.put(url, 'topic', make_body(content))
+        await store.close()
+        return store, stored
+
+    async def read_pages(self, urls):
+        store = PageStore(self.directory)
+        try:
+            return [await store.read(url) for url in urls]
+        finally:
+            await store.close()
+
+    def test_dedup(self):
+        content = b'<html>same</html>'
+        pages = [
+            ('http://a.com/', content), ('http://b.com/', content), ('http://c.com/', b'other')
+        ]
+        store, stored = asyncio.run(self.store_pages(pages))
+        self.assertEqual((store.stored, store.deduplicated), (2, 1))
+        self.assertEqual(stored, [url for url, _ in pages])
+        segment = os.path.join(self.directory, SEGMENT_NAME.format(1))
+        with open(segment, 'rb') as f:
+            self.assertEqual(f.read().count(b'\x1f\x8b'), 2)
+        read = asyncio.run(self.read_pages([url for url, _ in pages] + ['http://d.com/']))
+        self.assertEqual(read, [content, content, b'other', None])
+
+    def test_rotation(self):
+        pages = [(f'http://a.com/{i}', os.urandom(3000)) for i in range(6)]
+        store, _ = asyncio.run(self.store_pages(pages, segment_size=5000))
+        self.assertEqual(store.stored, 6)
+        self.assertEqual(list_segments(self.directory), [SEGMENT_NAME.format(i) for i in (1, 2, 3)])
+        read = asyncio.run(self.read_pages([url for url, _ in pages]))
+        self.assertEqual(read, [content for _, content in pages])
+
+    def test_restart_opens_new_segment(self):
+        asyncio.run(self.store_pages([('http://a.com/', b'first')]))
+        pages = [('http://b.com/', b'second'), ('http://c.com/', b'first')]
+        store, _ = asyncio.run(self.store_pages(pages))
+        # the content stored by the previous run is still deduplicated
+        self.assertEqual((store.stored, store.deduplicated), (1, 1))
+        self.assertEqual(list_segments(self.directory), [SEGMENT_NAME.format(i) for i in (1, 2)])
+        read = asyncio.run(self.read_pages(['http://a.com/', 'http://b.com/', 'http://c.com/']))
+        self.assertEqual(read, [b'first', b'second', b'first'])
+
+    def test_spilled_bodies_limit(self):
+        async def put_pages():
+            store = PageStore(self.directory, spilled_size=1)
+            spilled = make_body(os.urandom(2000))
+            await store.put('http://a.com/', 'topic', spilled)
+            # small bodies are not limited
+            await store.put('http://b.com/', 'topic', make_body(b'small'))
+            waiting = make_body(os.urandom(2000))
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(store.put('http://c.com/', 'topic', waiting), 0.1)
+            # a cancelled page does not keep its temporary file open
+            self.assertTrue(waiting.file.closed)
+            store.start()
+            await asyncio.wait_for(store.put('http://d.com/', 'topic', make_body(b'x' * 2000)), 1)
+            await store.close()
+            return store, spilled
+
+        store, spilled = asyncio.run(put_pages())
+        self.assertEqual(store.stored, 3)
+        self.assertTrue(spilled.file.closed)
+
+    def test_failed_batch_is_rolled_back(self):
+        async def store_failing():
+            stored = []
+            store = PageStore(self.directory, on_stored=stored.append)
+            append = store.segments.append
+            calls = []
+
+            def failing_append(chunks):
+                calls.append(chunks)
+                if len(calls) == 2:
+                    raise OSError('No space left on device')
+                return append(chunks)
+
+            store.segments.append = failing_append
+            bodies = [make_body(content) for content in (b'first', b'second', os.urandom(2000))]
+            for i, body in enumerate(bodies):
+                await store.put(f'http://a.com/{i}', 'topic', body)
+            store.start()
+            await store.close()
+            return store, stored, bodies
+
+        store, stored, bodies = asyncio.run(store_failing())
+        self.assertEqual(stored, [])
+        self.assertEqual((store.stored, store.deduplicated), (0, 0))
+        self.assertTrue(all(body.file.closed for body in bodies))
+        read = asyncio.run(self.read_pages(['http://a.com/0', 'http://a.com/1']))
+        self.assertEqual(read, [None, None])
+
+    def test_segment_number_after_gap(self):
+        for number in (3, 7):
+            open(os.path.join(self.directory, SEGMENT_NAME.format(number)), 'wb').close()
+        segments = SegmentWriter(self.directory)
+        location = segments.append([b'data'])
+        segments.close()
+        self.assertEqual(location, (SEGMENT_NAME.format(8), 0, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
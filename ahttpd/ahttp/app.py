@@ -0,0 +1,208 @@
+import io
+import os
+import sys
+import asyncio
+import inspect
+import importlib
+import subprocess
+import concurrent.futures
+from collections import namedtuple, deque
+from http import HTTPStatus
+from urllib.parse import unquote, unquote_to_bytes
+
+
+APP_PREFIX = '/app'
+APP_THREADS = 8
+APP_INTERFACES = ('auto', 'wsgi', 'asgi')
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECK_APP_CODE = (
+    'import sys; sys.path.insert(0, sys.argv[1]); '
+    'from ahttp.app import load_app; load_app(sys.argv[2], sys.argv[3] or None)'
+)
+
+AppResponse = namedtuple('AppResponse', ['status', 'headers', 'body'])
+
+
+def load_app(spec, app_path=None):
+    module_name, _, name = spec.partition(':')
+    if app_path and app_path not in sys.path:
+        sys.path.insert(0, app_path)
+    module = importlib.import_module(module_name)
+    return getattr(module, name or 'application')
+
+
+def check_app(spec, app_path=None):
+    # the master must not import the application: workers forked on a
+    # rolling restart would inherit the old module from its sys.modules
+    result = subprocess.run(
+        [sys.executable, '-c', CHECK_APP_CODE, PACKAGE_DIR, spec, app_path or ''],
+        capture_output=True, text=True
+    )
+    if result.returncode == 0:
+        return None
+    lines = result.stderr.strip().splitlines()
+    return lines[-1] if lines else f'exit code {result.returncode}'
+
+
+def is_asgi_app(app):
+    if inspect.isclass(app):
+        return False
+    if inspect.isfunction(app) or inspect.ismethod(app):
+        return inspect.iscoroutinefunction(app)
+    return inspect.iscoroutinefunction(getattr(app, '__call__', None))
+
+
+def get_status_line(status_code):
+    try:
+        return f'{status_code} {HTTPStatus(status_code).phrase}'
+    except ValueError:
+        return f'{status_code} Unknown'
+
+
+class AppHost:
+
+    def __init__(self, app, prefix, server_address):
+        self.app = app
+        self.prefix = prefix.rstrip('/')
+        self.server_name, self.server_port = server_address[:2]
+
+    def is_mounted(self, path):
+        return path.startswith(self.prefix) and (
+            len(path) == len(self.prefix) or path[len(self.prefix)] == '/'
+        )
+
+    def split_path(self, path):
+        return self.prefix, path[len(self.prefix):]
+
+
+class WSGIHost(AppHost):
+
+    def __init__(self, app, prefix, server_address, threads=APP_THREADS):
+        super().__init__(app, prefix, server_address)
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+
+    def get_environ(self, request, path, query):
+        script_name, path_info = self.split_path(path)
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': unquote_to_bytes(path_info).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.server_name,
+            'SERVER_PORT': str(self.server_port),
+            'SERVER_PROTOCOL': f'HTTP/{request.version}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(request.body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+        return environ
+
+    def run(self, environ):
+        response, chunks = [], []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+            return chunks.append
+
+        result = self.app(environ, start_response)
+        try:
+            chunks.extend(chunk for chunk in result if chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not response:
+            raise RuntimeError('WSGI application did not call start_response')
+        status, headers = response
+        return AppResponse(status, headers, b''.join(chunks))
+
+    async def call(self, request, path, query):
+        environ = self.get_environ(request, path, query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.run, environ)
+
+
+class ASGICycle:
+
+    def __init__(self, body):
+        self.messages = deque([{'type': 'http.request', 'body': body, 'more_body': False}])
+        self.finished = asyncio.Event()
+        self.status = None
+        self.headers = []
+        self.chunks = []
+
+    async def receive(self):
+        if self.messages:
+            return self.messages.popleft()
+        await self.finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = get_status_line(message['status'])
+            self.headers = [
+                (name.decode('latin-1'), value.decode('latin-1'))
+                for name, value in message.get('headers', [])
+            ]
+        elif message['type'] == 'http.response.body':
+            self.chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                self.finished.set()
+
+    def get_response(self):
+        if self.status is None:
+            raise RuntimeError('ASGI application did not start a response')
+        return AppResponse(self.status, self.headers, b''.join(self.chunks))
+
+
+class ASGIHost(AppHost):
+
+    def get_scope(self, request, path, query):
+        root_path, _ = self.split_path(path)
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': request.version,
+            'method': request.method,
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('utf-8'),
+            'query_string': query.encode('utf-8'),
+            'root_path': root_path,
+            'headers': [
+                (name.encode('latin-1'), value.encode('latin-1'))
+                for name, value in request.headers.items()
+            ],
+            'client': None,
+            'server': (self.server_name, self.server_port)
+        }
+
+    async def call(self, request, path, query):
+        cycle = ASGICycle(request.body)
+        try:
+            await self.app(self.get_scope(request, path, query), cycle.receive, cycle.send)
+        finally:
+            cycle.finished.set()
+        return cycle.get_response()
+
+
+def create_app_host(app, prefix=APP_PREFIX, interface='auto', server_address=('', 0),
+                    threads=APP_THREADS, app_path=None):
+    if isinstance(app, str):
+        app = load_app(app, app_path)
+    if interface == 'auto':
+        interface = 'asgi' if is_asgi_app(app) else 'wsgi'
+    if interface == 'asgi':
+        return ASGIHost(app, prefix, server_address)
+    return WSGIHost(app, prefix, server_address, threads)
@@ -0,0 +1,109 @@
+import os
+import time
+from html import escape
+from collections import namedtuple
+from urllib.parse import quote, parse_qs
+from .cache import LRUCache
+
+
+AUTOINDEX_PAGE_SIZE = 1000
+MAX_CACHED_DIRECTORIES = 256
+CONTENT_TYPE = 'text/html; charset=utf-8'
+
+DirectoryEntry = namedtuple('DirectoryEntry', ['name', 'is_dir', 'inode', 'size', 'mtime'])
+Listing = namedtuple('Listing', ['mtime', 'entries', 'pages'])
+
+
+def scan_directory(path):
+    entries = []
+    with os.scandir(path) as it:
+        for dir_entry in it:
+            if dir_entry.name.startswith('.'):
+                continue
+            # every entry is stated again, a file rewritten in place keeps its inode
+            try:
+                stat = dir_entry.stat()
+                entry = DirectoryEntry(
+                    dir_entry.name, dir_entry.is_dir(), dir_entry.inode(),
+                    stat.st_size, stat.st_mtime
+                )
+            except OSError:
+                continue
+            entries.append(entry)
+    entries.sort(key=lambda entry: (not entry.is_dir, entry.name))
+    return entries
+
+
+def get_page_number(query):
+    try:
+        return int(parse_qs(query).get('page', ['1'])[0])
+    except ValueError:
+        return None
+
+
+def get_pages_count(entries, page_size):
+    return max((len(entries) + page_size - 1) // page_size, 1)
+
+
+def format_entry(entry):
+    name = entry.name + '/' if entry.is_dir else entry.name
+    modified = time.strftime('%d-%b-%Y %H:%M', time.gmtime(entry.mtime))
+    size = '-' if entry.is_dir else str(entry.size)
+    return (
+        f'<tr><td><a href="{quote(name)}">{escape(name)}</a></td>'
+        f'<td>{modified}</td><td align="right">{size}</td></tr>'
+    )
+
+
+def format_pager(page, pages):
+    links = []
+    if page > 1:
+        links.append(f'<a href="?page={page - 1}">&larr; previous</a>')
+    links.append(f'page {page} of {pages}')
+    if page < pages:
+        links.append(f'<a href="?page={page + 1}">next &rarr;</a>')
+    return '<p>' + ' | '.join(links) + '</p>'
+
+
+def render_listing(uri, entries, page, page_size):
+    pages = get_pages_count(entries, page_size)
+    title = escape(f'Index of {uri}')
+    rows = [format_entry(entry) for entry in entries[(page - 1) * page_size:page * page_size]]
+    if uri != '/':
+        rows.insert(0, '<tr><td><a href="../">../</a></td><td></td><td></td></tr>')
+    parts = [
+        f'<html><head><meta charset="utf-8"><title>{title}</title></head><body>',
+        f'<h1>{title}</h1><hr><table>'
+    ]
+    parts += rows
+    parts.append('</table><hr>')
+    if pages > 1:
+        parts.append(format_pager(page, pages))
+    parts.append('</body></html>\n')
+    return '\n'.join(parts).encode()
+
+
+class DirectoryIndex:
+
+    def __init__(self, page_size=AUTOINDEX_PAGE_SIZE, max_directories=MAX_CACHED_DIRECTORIES):
+        self.page_size = page_size
+        self.listings = LRUCache(max_directories)
+        self.scans = 0
+
+    async def get_listing(self, path, stat, file_io):
+        listing = self.listings.get(path)
+        if listing is not None and listing.mtime == stat.st_mtime_ns:
+            return listing
+        entries = await file_io.run(scan_directory, path)
+        self.scans += 1
+        return self.listings.put(path, Listing(stat.st_mtime_ns, entries, {}))
+
+    async def get_page(self, path, stat, uri, page, file_io):
+        listing = await self.get_listing(path, stat, file_io)
+        if page is None or not 1 <= page <= get_pages_count(listing.entries, self.page_size):
+            return None
+        body = listing.pages.get(page)
+        if body is None:
+            body = await file_io.run(render_listing, uri, listing.entries, page, self.page_size)
+            listing.pages[page] = body
+        return body
@@ -0,0 +1,114 @@
+from collections import OrderedDict, namedtuple
+
+
+MAX_CACHE_SIZE = 64 * 1024 * 1024
+MAX_CACHED_FILE_SIZE = 1024 * 1024
+MAX_LRU_CACHE_ENTRIES = 4096
+
+CacheEntry = namedtuple(
+    'CacheEntry',
+    ['content', 'headers', 'content_type', 'mtime', 'size', 'inode']
+)
+
+
+class FileCache:
+
+    def __init__(self, max_size=MAX_CACHE_SIZE, max_file_size=MAX_CACHED_FILE_SIZE):
+        self.max_size = max_size
+        self.max_file_size = min(max_file_size, max_size)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def is_cacheable(self, size):
+        return size <= self.max_file_size
+
+    def is_fresh(self, entry, stat):
+        return (
+            entry.mtime == stat.st_mtime_ns
+            and entry.size == stat.st_size
+            and entry.inode == stat.st_ino
+        )
+
+    def remove(self, path):
+        entry = self.entries.pop(path)
+        self.size -= len(entry.content)
+
+    def get(self, path, stat):
+        entry = self.entries.get(path)
+        if entry is not None and not self.is_fresh(entry, stat):
+            self.remove(path)
+            self.invalidations += 1
+            entry = None
+        if entry is None:
+            # a file too large to be cached is not a miss the cache size could fix
+            if self.is_cacheable(stat.st_size):
+                self.misses += 1
+            return None
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return entry
+
+    def put(self, path, stat, content, headers, content_type):
+        if not self.is_cacheable(len(content)):
+            return None
+        if path in self.entries:
+            self.remove(path)
+        while self.size + len(content) > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.content)
+            self.evictions += 1
+        entry = CacheEntry(
+            content, headers, content_type,
+            stat.st_mtime_ns, stat.st_size, stat.st_ino
+        )
+        self.entries[path] = entry
+        self.size += len(content)
+        return entry
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+class LRUCache:
+
+    def __init__(self, max_entries=MAX_LRU_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses
+        }
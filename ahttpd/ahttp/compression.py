@@ -0,0 +1,64 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+MIN_COMPRESS_SIZE = 256
+MAX_COMPRESS_SIZE = 8 * 1024 * 1024
+GZIP_LEVEL = 6
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/x-javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml'
+}
+ENCODING_EXTENSIONS = {
+    'br': '.br',
+    'gzip': '.gz'
+}
+PREFERRED_ENCODINGS = ['br', 'gzip']
+
+
+def compress_gzip(data):
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+COMPRESSORS = {'gzip': compress_gzip}
+if brotli is not None:
+    COMPRESSORS['br'] = brotli.compress
+
+
+def parse_accept_encoding(value):
+    weights = {}
+    for item in value.split(','):
+        encoding, _, params = item.partition(';')
+        encoding = encoding.strip().lower()
+        if not encoding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[encoding] = weight
+    default = weights.get('*', 0.0)
+    return [
+        encoding for encoding in PREFERRED_ENCODINGS
+        if weights.get(encoding, default) > 0
+    ]
+
+
+def is_compressible(content_type, size=MIN_COMPRESS_SIZE):
+    if not MIN_COMPRESS_SIZE <= size <= MAX_COMPRESS_SIZE:
+        return False
+    return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+
+def compress(encoding, data):
+    return COMPRESSORS[encoding](data)
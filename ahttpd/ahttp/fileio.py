@@ -0,0 +1,99 @@
+import asyncio
+import os
+import concurrent.futures
+
+
+IO_THREADS = 4
+READ_CHUNK_SIZE = 256 * 1024
+SENDFILE_CHUNK_SIZE = 1024 * 1024
+RWF_NOWAIT = getattr(os, 'RWF_NOWAIT', None)
+
+
+def open_file(path):
+    f = open(path, mode='rb')
+    try:
+        stat = os.fstat(f.fileno())
+    except OSError:
+        f.close()
+        raise
+    return f, stat
+
+
+def read_file(path):
+    f, stat = open_file(path)
+    with f:
+        return f.read(), stat
+
+
+class AsyncFileIO:
+
+    def __init__(self, threads=IO_THREADS):
+        self.executor = None
+        if threads > 0:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                threads, thread_name_prefix='ahttp-io'
+            )
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.prefetched = 0
+        self.probe = bytearray(1)
+
+    async def run(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    async def stat(self, path):
+        return await self.run(os.stat, path)
+
+    async def open(self, path):
+        return await self.run(open_file, path)
+
+    async def read(self, path):
+        return await self.run(read_file, path)
+
+    async def iter_chunks(self, f, offset, count, chunk_size=READ_CHUNK_SIZE):
+        while count > 0:
+            chunk = await self.run(os.pread, f.fileno(), min(chunk_size, count), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            count -= len(chunk)
+            yield chunk
+
+    def is_cached(self, f, offset, count):
+        # only the last byte is probed, the kernel reads a file ahead sequentially;
+        # a missed probe starts the readahead as well
+        if RWF_NOWAIT is None:
+            return True
+        try:
+            os.preadv(f.fileno(), [self.probe], offset + count - 1, RWF_NOWAIT)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+        return True
+
+    async def prefetch(self, f, offset, count):
+        # a cold range is read in an I/O thread, so that sendfile on the
+        # event loop finds it in the page cache instead of waiting for the disk
+        if self.executor is None or self.is_cached(f, offset, count):
+            return
+        self.prefetched += 1
+        await self.run(os.pread, f.fileno(), count, offset)
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'prefetched': self.prefetched
+        }
@@ -0,0 +1,59 @@
+import os
+import mmap
+from .cache import LRUCache
+
+
+MAX_MAPPINGS = 256
+MMAP_CHUNK_SIZE = 256 * 1024
+MADV_WILLNEED = getattr(mmap, 'MADV_WILLNEED', None)
+MADV_DONTNEED = getattr(mmap, 'MADV_DONTNEED', None)
+
+
+class FileMapping:
+
+    def __init__(self, path):
+        with open(path, mode='rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+
+    def advise(self, option, offset, size):
+        if option is None:
+            return
+        start = offset - offset % mmap.PAGESIZE
+        self.map.madvise(option, start, offset + size - start)
+
+    def iter_chunks(self, offset, count, chunk_size=MMAP_CHUNK_SIZE):
+        while count > 0:
+            size = min(chunk_size, count)
+            self.advise(MADV_WILLNEED, offset, size)
+            yield self.view[offset:offset + size]
+            # drop the sent pages from the worker's page tables, they stay in the page cache
+            self.advise(MADV_DONTNEED, offset, size)
+            offset += size
+            count -= size
+
+
+class MappingCache:
+
+    def __init__(self, max_mappings=MAX_MAPPINGS):
+        self.mappings = LRUCache(max_mappings)
+        self.opened = 0
+
+    def is_fresh(self, mapping, stat):
+        return (
+            mapping.stat.st_mtime_ns == stat.st_mtime_ns
+            and mapping.stat.st_size == stat.st_size
+            and mapping.stat.st_ino == stat.st_ino
+        )
+
+    async def get(self, path, stat, file_io):
+        mapping = self.mappings.get(path)
+        if mapping is None or not self.is_fresh(mapping, stat):
+            mapping = await file_io.run(FileMapping, path)
+            self.opened += 1
+            self.mappings.put(path, mapping)
+        return mapping
+
+    def stats(self):
+        return {**self.mappings.stats(), 'opened': self.opened}
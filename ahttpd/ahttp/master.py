@@ -0,0 +1,153 @@
+import os
+import time
+import signal
+import socket
+import logging
+from collections import deque
+from multiprocessing import Process, Event
+from multiprocessing.connection import wait
+
+
+GRACEFUL_TIMEOUT = 30
+TIMEOUT_WORKER_READY = 10
+MIN_WORKER_LIFETIME = 1
+MAX_RESTART_DELAY = 30
+
+
+class Master:
+
+    def __init__(self, target, args, kwargs, workers, graceful_timeout=GRACEFUL_TIMEOUT,
+                 metrics_store=None, sockets=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs
+        self.workers_count = workers
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}
+        self.retiring = {}
+        self.started = {}
+        self.metrics_store = metrics_store
+        self.free_slots = deque(range(len(metrics_store))) if metrics_store is not None else deque()
+        self.slots = {}
+        # listening sockets stay open in the master, a replacement worker takes over
+        # the socket of the worker it replaces together with its accept backlog
+        self.sockets = sockets or []
+        self.listeners = {}
+        self.restart_delay = 0
+        self.signals = deque()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+
+    def get_worker_kwargs(self, ready, slot, listener):
+        kwargs = {**self.kwargs, 'ready': ready}
+        if self.metrics_store is not None:
+            kwargs.update(metrics_store=self.metrics_store, slot=slot)
+        if self.sockets:
+            kwargs['sock'] = self.sockets[listener % len(self.sockets)]
+        return kwargs
+
+    def spawn(self, listener=0):
+        ready = Event()
+        slot = self.free_slots.popleft() if self.free_slots else None
+        kwargs = self.get_worker_kwargs(ready, slot, listener)
+        process = Process(target=self.target, args=self.args, kwargs=kwargs)
+        process.start()
+        self.workers[process.sentinel] = process
+        self.started[process.sentinel] = time.monotonic()
+        self.listeners[process.sentinel] = listener
+        if slot is not None:
+            self.slots[process.sentinel] = slot
+        logging.info(f'Worker {process.pid} started.')
+        return process, ready
+
+    def handle_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def install_signal_handlers(self):
+        self.wakeup_writer.setblocking(False)
+        signal.set_wakeup_fd(self.wakeup_writer.fileno())
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self.handle_signal)
+
+    def drain_wakeup(self):
+        self.wakeup_reader.setblocking(False)
+        try:
+            while self.wakeup_reader.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def release_slot(self, sentinel):
+        slot = self.slots.pop(sentinel, None)
+        if slot is not None:
+            self.metrics_store.clear(slot)
+            self.free_slots.append(slot)
+
+    def reap(self, sentinels):
+        for sentinel in sentinels:
+            self.release_slot(sentinel)
+            listener = self.listeners.pop(sentinel, 0)
+            if sentinel in self.retiring:
+                process = self.retiring.pop(sentinel)
+                process.join()
+                logging.info(f'Worker {process.pid} stopped.')
+            elif sentinel in self.workers:
+                process = self.workers.pop(sentinel)
+                lifetime = time.monotonic() - self.started.pop(sentinel)
+                process.join()
+                logging.warning(f'Worker {process.pid} died with exit code {process.exitcode}.')
+                self.schedule_restart(lifetime)
+                self.spawn(listener)
+
+    def schedule_restart(self, lifetime):
+        if lifetime >= MIN_WORKER_LIFETIME:
+            self.restart_delay = 0
+            return
+        self.restart_delay = min(max(self.restart_delay * 2, 0.1), MAX_RESTART_DELAY)
+        logging.warning(f'Worker crashed right after start, restarting in {self.restart_delay}s.')
+        time.sleep(self.restart_delay)
+
+    def retire(self, process):
+        del self.workers[process.sentinel]
+        self.started.pop(process.sentinel, None)
+        self.retiring[process.sentinel] = process
+        process.terminate()
+
+    def reload(self):
+        logging.info('Rolling restart of workers.')
+        for process in list(self.workers.values()):
+            _, ready = self.spawn(self.listeners[process.sentinel])
+            if not ready.wait(TIMEOUT_WORKER_READY):
+                logging.warning('New worker is not ready, old worker is stopped anyway.')
+            self.retire(process)
+
+    def stop(self):
+        logging.info('Graceful shutdown of workers.')
+        for process in list(self.workers.values()):
+            self.retire(process)
+        deadline = time.monotonic() + self.graceful_timeout
+        for process in self.retiring.values():
+            process.join(max(deadline - time.monotonic(), 0))
+        for process in self.retiring.values():
+            if process.is_alive():
+                logging.warning(f'Worker {process.pid} did not stop in time, killing it.')
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+        self.retiring = {}
+
+    def run(self):
+        self.install_signal_handlers()
+        for listener in range(self.workers_count):
+            self.spawn(listener)
+        while True:
+            sentinels = list(self.workers) + list(self.retiring)
+            ready = wait(sentinels + [self.wakeup_reader])
+            if self.wakeup_reader in ready:
+                self.drain_wakeup()
+            while self.signals:
+                signum = self.signals.popleft()
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.stop()
+                    return
+            self.reap([sentinel for sentinel in ready if sentinel != self.wakeup_reader])
@@ -0,0 +1,233 @@
+import os
+from bisect import bisect_left
+from multiprocessing import Array
+
+
+STATUS_PATH = '/__status'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PHASES = ('accept', 'parse', 'handle', 'send')
+COUNTERS = {
+    'connections': 'Accepted connections.',
+    'sent_bytes': 'Bytes of responses sent.',
+    'header_timeouts': 'Connections closed because a request was not received in time.',
+    'accept_pauses': 'Times accept was paused on reaching the connection limit.'
+}
+CACHES = ('file', 'encoding')
+CACHE_STATS = {
+    'entries': ('ahttpd_cache_entries', 'gauge', 'Entries held in the cache.'),
+    'size': ('ahttpd_cache_size_bytes', 'gauge', 'Bytes held in the cache.'),
+    'hits': ('ahttpd_cache_hits_total', 'counter', 'Cache hits.'),
+    'misses': ('ahttpd_cache_misses_total', 'counter', 'Cache misses.'),
+    'evictions': ('ahttpd_cache_evictions_total', 'counter', 'Entries evicted to free space.'),
+    'invalidations': (
+        'ahttpd_cache_invalidations_total', 'counter', 'Entries dropped because the file changed.'
+    )
+}
+FILE_IO_STATS = {
+    'pending': ('ahttpd_file_io_pending', 'gauge', 'File operations queued or running.'),
+    'max_pending': ('ahttpd_file_io_max_pending', 'gauge', 'Most file operations pending at once.'),
+    'completed': ('ahttpd_file_io_completed_total', 'counter', 'File operations completed.'),
+    'prefetched': (
+        'ahttpd_file_io_prefetched_total', 'counter', 'Uncached file ranges read before sendfile.'
+    )
+}
+OTHER_STATUS = 0
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class Histogram:
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def values(self):
+        return self.counts + [self.sum]
+
+
+class MetricsStore:
+
+    def __init__(self, slots, size):
+        self.size = size
+        # one writer per slot and monotonic values, so a lock is not worth
+        # the risk of a worker killed while holding it
+        self.slots = [Array('d', size + 1, lock=False) for _ in range(slots)]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def write(self, slot, pid, values):
+        self.slots[slot][1:] = values
+        self.slots[slot][0] = pid
+
+    def clear(self, slot):
+        self.slots[slot][:] = [0.0] * (self.size + 1)
+
+    def read(self):
+        for slot in self.slots:
+            pid, *values = slot[:]
+            if pid:
+                yield int(pid), values
+
+
+class Metrics:
+
+    def __init__(self, status_codes):
+        self.status_codes = sorted({*status_codes, OTHER_STATUS})
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.statuses = dict.fromkeys(self.status_codes, 0)
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.accept = self.phases['accept']
+        self.parse = self.phases['parse']
+        self.handle = self.phases['handle']
+        self.send = self.phases['send']
+        self.caches = dict.fromkeys(CACHES)
+        self.file_io = None
+        self.store = None
+        self.slot = None
+
+    def __len__(self):
+        return (
+            len(COUNTERS) + len(self.status_codes) + len(PHASES) * (len(LATENCY_BUCKETS) + 2)
+            + len(CACHES) * len(CACHE_STATS) + len(FILE_IO_STATS)
+        )
+
+    def attach(self, store, slot):
+        self.store = store
+        self.slot = slot
+
+    def add_cache(self, name, cache):
+        self.caches[name] = cache
+
+    def get_cache_stats(self, name):
+        # a disabled cache keeps its place in the layout with zero values
+        cache = self.caches[name]
+        return cache.stats() if cache is not None else dict.fromkeys(CACHE_STATS, 0)
+
+    def set_file_io(self, file_io):
+        self.file_io = file_io
+
+    def get_file_io_stats(self):
+        if self.file_io is None:
+            return dict.fromkeys(FILE_IO_STATS, 0)
+        return self.file_io.stats()
+
+    def count(self, name):
+        self.counters[name] += 1
+
+    def count_connection(self, accept_delay):
+        self.counters['connections'] += 1
+        self.accept.observe(accept_delay)
+
+    def count_response(self, response, send_time):
+        status_code = int(response.head[9:12])
+        if status_code not in self.statuses:
+            status_code = OTHER_STATUS
+        self.statuses[status_code] += 1
+        self.counters['sent_bytes'] += len(response.head) + len(response.body) + response.count
+        self.send.observe(send_time)
+
+    def values(self):
+        values = [self.counters[name] for name in COUNTERS]
+        values += [self.statuses[status_code] for status_code in self.status_codes]
+        for phase in PHASES:
+            values += self.phases[phase].values()
+        for name in CACHES:
+            stats = self.get_cache_stats(name)
+            values += [stats[stat] for stat in CACHE_STATS]
+        stats = self.get_file_io_stats()
+        values += [stats[stat] for stat in FILE_IO_STATS]
+        return values
+
+    def unpack(self, values):
+        values = iter(values)
+        counters = {name: next(values) for name in COUNTERS}
+        statuses = {status_code: next(values) for status_code in self.status_codes}
+        phases = {}
+        for phase in PHASES:
+            counts = [next(values) for _ in range(len(LATENCY_BUCKETS) + 1)]
+            phases[phase] = (counts, next(values))
+        caches = {name: {stat: next(values) for stat in CACHE_STATS} for name in CACHES}
+        file_io = {stat: next(values) for stat in FILE_IO_STATS}
+        return counters, statuses, phases, caches, file_io
+
+    def publish(self):
+        if self.store is not None and self.slot is not None:
+            self.store.write(self.slot, os.getpid(), self.values())
+
+    def collect(self):
+        self.publish()
+        if self.store is None or self.slot is None:
+            return [(os.getpid(), self.values())]
+        return list(self.store.read())
+
+    def render(self):
+        workers = [(pid, self.unpack(values)) for pid, values in self.collect()]
+        lines = []
+        for name, description in COUNTERS.items():
+            lines += [
+                f'# HELP ahttpd_{name}_total {description}',
+                f'# TYPE ahttpd_{name}_total counter'
+            ]
+            for pid, (counters, *_) in workers:
+                lines.append(f'ahttpd_{name}_total{{worker="{pid}"}} {counters[name]:.0f}')
+        lines += [
+            '# HELP ahttpd_responses_total Responses sent, by status code.',
+            '# TYPE ahttpd_responses_total counter'
+        ]
+        for pid, (_, statuses, *_) in workers:
+            for status_code, count in statuses.items():
+                status = status_code if status_code != OTHER_STATUS else 'other'
+                lines.append(
+                    f'ahttpd_responses_total{{worker="{pid}",status="{status}"}} {count:.0f}'
+                )
+        lines += [
+            '# HELP ahttpd_phase_seconds Time spent in accept, parse, handle and send phases.',
+            '# TYPE ahttpd_phase_seconds histogram'
+        ]
+        for pid, (_, _, phases, *_) in workers:
+            for phase, (counts, total) in phases.items():
+                lines += self.render_histogram(f'worker="{pid}",phase="{phase}"', counts, total)
+        lines += self.render_caches(workers)
+        lines += self.render_file_io(workers)
+        return '\n'.join(lines) + '\n'
+
+    def render_caches(self, workers):
+        # workers share the configuration, so only the caches enabled here are shown
+        caches = [name for name in CACHES if self.caches[name] is not None]
+        if not caches:
+            return []
+        lines = []
+        for stat, (metric, metric_type, description) in CACHE_STATS.items():
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {metric_type}']
+            for pid, (*_, worker_caches, _) in workers:
+                for name in caches:
+                    value = worker_caches[name][stat]
+                    lines.append(f'{metric}{{worker="{pid}",cache="{name}"}} {value:.0f}')
+        return lines
+
+    def render_file_io(self, workers):
+        lines = []
+        for stat, (metric, metric_type, description) in FILE_IO_STATS.items():
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {metric_type}']
+            for pid, (*_, file_io) in workers:
+                lines.append(f'{metric}{{worker="{pid}"}} {file_io[stat]:.0f}')
+        return lines
+
+    def render_histogram(self, labels, counts, total):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'ahttpd_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative:.0f}')
+        lines.append(f'ahttpd_phase_seconds_sum{{{labels}}} {total}')
+        lines.append(f'ahttpd_phase_seconds_count{{{labels}}} {cumulative:.0f}')
+        return lines
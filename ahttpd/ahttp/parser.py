@@ -0,0 +1,122 @@
+import re
+from collections import namedtuple
+
+
+MAX_MESSAGE_LEN = 10240
+MAX_BODY_LEN = 1024 * 1024
+REQUEST_TERMINATOR = b'\r\n\r\n'
+LINE_TERMINATOR = b'\r\n'
+HTTP_VERSIONS = {b'HTTP/1.0': '1.0', b'HTTP/1.1': '1.1'}
+REGEXP_CONTENT_LENGTH = re.compile(rb'\r\ncontent-length:[ \t]*(\d+)', re.IGNORECASE)
+REGEXP_EXPECT_CONTINUE = re.compile(rb'\r\nexpect:[ \t]*100-continue', re.IGNORECASE)
+CONTINUE_RESPONSE = b'HTTP/1.1 100 Continue\r\n\r\n'
+
+Request = namedtuple('Request', ['method', 'uri', 'version', 'headers', 'body'], defaults=[b''])
+
+
+class RequestReader:
+
+    def __init__(self, max_message_len=MAX_MESSAGE_LEN, max_body_len=MAX_BODY_LEN):
+        self.max_message_len = max_message_len
+        self.max_body_len = max_body_len
+        self.buffer = bytearray()
+        self.search_from = 0
+        self.message_len = 0
+        self.body_len = 0
+        self.expect_continue = False
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data):
+        self.buffer += data
+
+    def is_overflow(self):
+        if self.message_len:
+            return self.body_len > self.max_body_len
+        return len(self.buffer) > self.max_message_len
+
+    def pending(self):
+        return self.message_len - len(self.buffer) if self.message_len else 0
+
+    def is_continue_expected(self):
+        expected = self.expect_continue and not self.is_overflow()
+        self.expect_continue = False
+        return expected
+
+    def next_request(self):
+        buffer = self.buffer
+        if not self.message_len:
+            end = buffer.find(REQUEST_TERMINATOR, self.search_from)
+            if end == -1:
+                if len(buffer) >= len(REQUEST_TERMINATOR):
+                    self.search_from = len(buffer) - len(REQUEST_TERMINATOR) + 1
+                return None
+            end += len(REQUEST_TERMINATOR)
+            self.search_from = 0
+            match = REGEXP_CONTENT_LENGTH.search(buffer, 0, end)
+            self.body_len = int(match.group(1)) if match is not None else 0
+            self.message_len = end + self.body_len
+            if self.body_len and len(buffer) < self.message_len:
+                self.expect_continue = REGEXP_EXPECT_CONTINUE.search(buffer, 0, end) is not None
+        end = self.message_len
+        if len(buffer) < end:
+            return None
+        self.message_len = self.body_len = 0
+        self.expect_continue = False
+        request = bytes(buffer) if end == len(buffer) else bytes(buffer[:end])
+        del buffer[:end]
+        return request
+
+    def flush(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        self.search_from = self.message_len = self.body_len = 0
+        self.expect_continue = False
+        return data
+
+
+def parse_headers(block):
+    headers = {}
+    if not block:
+        return headers
+    for line in block.split('\r\n'):
+        name, sep, value = line.partition(':')
+        if not sep:
+            return None
+        headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def get_content_length(headers):
+    value = headers.get('content-length', '0')
+    return int(value) if value.isdigit() else None
+
+
+def parse_request(data):
+    line_end = data.find(LINE_TERMINATOR)
+    head_end = data.find(REQUEST_TERMINATOR)
+    if line_end == -1 or head_end == -1:
+        return None
+    parts = data[:line_end].split(b' ')
+    if len(parts) != 3 or not parts[0].isalpha() or not parts[1]:
+        return None
+    method, uri, version = parts
+    version = HTTP_VERSIONS.get(version)
+    if version is None:
+        return None
+    block = data[line_end + len(LINE_TERMINATOR):head_end].decode('latin-1')
+    headers = parse_headers(block)
+    if headers is None:
+        return None
+    content_length = get_content_length(headers)
+    if content_length is None:
+        return None
+    body = data[head_end + len(REQUEST_TERMINATOR):]
+    return Request(
+        method.decode('ascii'),
+        uri.decode('utf-8', errors='replace'),
+        version,
+        headers,
+        body if len(body) == content_length else None
+    )
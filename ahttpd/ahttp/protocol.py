@@ -0,0 +1,200 @@
+import asyncio
+import time
+from collections import deque
+from .server import AsyncServer, log_connection_error
+from .parser import RequestReader, CONTINUE_RESPONSE
+
+
+MAX_PIPELINED_REQUESTS = 16
+
+
+class HttpProtocol(asyncio.Protocol):
+
+    def __init__(self, server, accepted):
+        self.server = server
+        self.loop = server.loop
+        self.transport = None
+        self.reader = RequestReader(max_body_len=server.max_body_size)
+        self.requests = deque()
+        self.request_ready = asyncio.Event()
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.reading_paused = False
+        self.waiting = False
+        self.timeout_handle = None
+        self.task = None
+        self.served = 0
+        self.accepted = accepted
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.reset_timeout(self.server.header_timeout)
+
+    def data_received(self, data):
+        receiving = bool(self.reader)
+        self.reader.feed(data)
+        if self.parse_requests():
+            receiving = False
+        if self.reader.is_overflow():
+            self.finish_reading()
+        elif not self.reader:
+            self.cancel_timeout()
+        elif not receiving:
+            self.reset_timeout(self.server.header_timeout)
+        if self.waiting:
+            self.send_continue()
+        if len(self.requests) >= MAX_PIPELINED_REQUESTS and not self.reading_paused:
+            self.transport.pause_reading()
+            self.reading_paused = True
+
+    def eof_received(self):
+        self.finish_reading()
+        return True
+
+    def connection_lost(self, exc):
+        # the transport closes itself on a send error and reports it only here
+        if exc is not None:
+            log_connection_error(exc)
+        self.cancel_timeout()
+        self.can_write.set()
+        if self.task is not None:
+            self.task.cancel()
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    def parse_requests(self):
+        parsed = 0
+        request = self.reader.next_request()
+        while request is not None:
+            self.requests.append(request)
+            parsed += 1
+            request = self.reader.next_request()
+        if self.requests:
+            self.request_ready.set()
+        return parsed
+
+    def send_continue(self):
+        # an interim response must not get ahead of responses still being sent
+        if not self.requests and self.reader.is_continue_expected():
+            self.transport.write(CONTINUE_RESPONSE)
+
+    def finish_reading(self):
+        self.cancel_timeout()
+        if self.reader:
+            self.requests.append(self.reader.flush())
+        self.requests.append(None)
+        self.request_ready.set()
+        if not self.transport.is_closing() and not self.reading_paused:
+            self.transport.pause_reading()
+            self.reading_paused = True
+
+    def on_timeout(self):
+        self.timeout_handle = None
+        if self.reader:
+            self.server.metrics.count('header_timeouts')
+        self.finish_reading()
+
+    def reset_timeout(self, timeout):
+        self.cancel_timeout()
+        self.timeout_handle = self.loop.call_later(timeout, self.on_timeout)
+
+    def cancel_timeout(self):
+        if self.timeout_handle is not None:
+            self.timeout_handle.cancel()
+            self.timeout_handle = None
+
+    async def next_request(self):
+        while not self.requests:
+            self.request_ready.clear()
+            self.server.set_idle(self.served > 0 and not self.reader)
+            self.send_continue()
+            self.waiting = True
+            try:
+                await self.request_ready.wait()
+            finally:
+                self.waiting = False
+                self.server.set_idle(False)
+        request = self.requests.popleft()
+        resume = request is not None and len(self.requests) < MAX_PIPELINED_REQUESTS
+        if self.reading_paused and resume:
+            self.transport.resume_reading()
+            self.reading_paused = False
+        return request
+
+    async def drain(self):
+        await self.can_write.wait()
+        if self.transport.is_closing():
+            raise ConnectionResetError('Connection lost')
+
+    async def write(self, chunk):
+        self.transport.write(chunk)
+        await self.drain()
+
+    async def sendfile(self, f, offset, count):
+        # the socket is written directly only when the transport has nothing buffered
+        sock = None
+        if not self.transport.get_write_buffer_size():
+            sock = self.transport.get_extra_info('socket')
+        await self.server.send_file(
+            lambda *args: self.loop.sendfile(self.transport, *args), self.write, f, offset, count,
+            sock
+        )
+
+    async def send_mapping(self, mapping, offset, count):
+        for chunk in mapping.iter_chunks(offset, count):
+            self.transport.write(chunk)
+            await self.drain()
+
+    async def send_response(self, response):
+        try:
+            self.transport.writelines((response.head, response.body))
+            if response.mapping is not None:
+                await self.send_mapping(response.mapping, response.offset, response.count)
+            elif response.file is not None and response.count:
+                await self.drain()
+                await self.sendfile(response.file, response.offset, response.count)
+            await self.drain()
+        finally:
+            if response.file is not None:
+                response.file.close()
+
+    async def process(self):
+        self.server.metrics.count_connection(time.perf_counter() - self.accepted)
+        try:
+            while True:
+                request = await self.next_request()
+                if request is None:
+                    break
+                self.served += 1
+                response = await self.server.request_handler.get_response(
+                    request, self.server.can_keep_alive(self.served)
+                )
+                started = time.perf_counter()
+                await self.send_response(response)
+                self.server.metrics.count_response(response, time.perf_counter() - started)
+                if not response.keep_alive or self.server.closing:
+                    break
+                if not self.requests and not self.reader:
+                    self.reset_timeout(self.server.keep_alive_timeout)
+        except OSError as e:
+            log_connection_error(e)
+        finally:
+            self.cancel_timeout()
+            self.transport.close()
+
+
+class ProtocolServer(AsyncServer):
+
+    async def handle(self, client_socket, accepted):
+        protocol = HttpProtocol(self, accepted)
+        protocol.task = asyncio.current_task()
+        try:
+            await self.loop.connect_accepted_socket(lambda: protocol, client_socket)
+        except OSError:
+            client_socket.close()
+            return
+        await protocol.process()
@@ -1,32 +1,85 @@
+import asyncio
+import logging
 import time
 import sys
 import os
 import re
+import stat as stat_module
 import mimetypes
 from urllib.parse import unquote
-from datetime import datetime
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from .cache import CacheEntry, LRUCache
+from .autoindex import CONTENT_TYPE as LISTING_CONTENT_TYPE, get_page_number
+from .fileio import AsyncFileIO
+from .metrics import Metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE, STATUS_PATH
+from .parser import MAX_BODY_LEN, get_content_length, parse_request
+from .compression import (
+    COMPRESSORS,
+    ENCODING_EXTENSIONS,
+    compress,
+    is_compressible,
+    parse_accept_encoding
+)
 
 
-REGEXP_REQUEST = re.compile(r'(?P<method>(GET|HEAD)) (?P<uri>.+) HTTP\/\d\.\d.+')
+REGEXP_RANGE = re.compile(r'bytes=(?P<start>\d*)-(?P<end>\d*)$')
 ALLOWED_METHODS = ['GET', 'HEAD']
 MESSAGES = {
     200: 'OK',
+    206: 'Partial Content',
+    304: 'Not Modified',
     400: 'Bad Request',
     403: 'Forbidden',
     404: 'Not Found',
-    405: 'Method Not Allowed'
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    416: 'Range Not Satisfiable',
+    500: 'Internal Server Error'
 }
 
+SERVER_NAME = 'Nano HTTP Server - Python/' + sys.version.split()[0]
+STATUS_HEADERS = {
+    status_code: f'HTTP/1.1 {status_code} {message}\r\nServer: {SERVER_NAME}\r\n'
+    for status_code, message in MESSAGES.items()
+}
+APP_SKIPPED_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'date', 'server'}
+BODILESS_STATUSES = {204, 304}
+CONNECTION_HEADERS = {
+    True: b'Connection: keep-alive\r\n\r\n',
+    False: b'Connection: close\r\n\r\n'
+}
+
+Response = namedtuple(
+    'Response',
+    ['head', 'body', 'file', 'offset', 'count', 'keep_alive', 'mapping'],
+    defaults=[b'', None, 0, 0, False, None]
+)
+
 
 class AsyncRequestHandler:
 
-    def __init__(self, document_root):
+    def __init__(self, document_root, cache=None, encoding_cache=None, executor=None,
+                file_io=None, metrics=None, directory_index=None, mapping_cache=None,
+                app_host=None, max_body_size=MAX_BODY_LEN):
         self.document_root = document_root
-        self.headers_buffer = []
-
-    def get_file_content(self, path):
-        with open(path, mode='rb') as f:
-            return f.read()
+        self.cache = cache
+        self.encoding_cache = encoding_cache
+        self.executor = executor
+        self.file_io = file_io if file_io is not None else AsyncFileIO(threads=0)
+        self.metrics = metrics if metrics is not None else Metrics(MESSAGES)
+        self.metrics.add_cache('file', cache)
+        self.metrics.add_cache('encoding', encoding_cache)
+        self.metrics.set_file_io(self.file_io)
+        self.directory_index = directory_index
+        self.mapping_cache = mapping_cache
+        self.app_host = app_host
+        self.max_body_size = max_body_size
+        self.header_cache = LRUCache()
+        self.error_headers = {}
+        self.date_header = b''
+        self.date_timer = None
 
     def process_uri(self, uri):
         uri = uri.lstrip("/").split('?')[0]
@@ -41,14 +94,14 @@ class AsyncRequestHandler:
     def is_uri_safe(self, uri):
         return uri.startswith(self.document_root)
 
-    def parse_request(self, request):
-        match = re.match(REGEXP_REQUEST, request)
-        if match:
-            return match.groupdict()['method'], self.process_uri(match.groupdict()['uri'])
-        return None, None
+    def is_keep_alive(self, version, headers):
+        connection = headers.get('connection', '').lower()
+        if version == '1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
 
-    def get_status_line(self, status_code):
-        return f'HTTP/1.1 {status_code} {MESSAGES[status_code]}\r\n'
+    def get_status_headers(self, status_code):
+        return STATUS_HEADERS[status_code]
 
     def get_content_type(self, uri):
         mimetype = mimetypes.guess_type(uri)[0]
@@ -57,49 +110,421 @@ class AsyncRequestHandler:
         return mimetype
 
     def get_date(self):
-        dt = datetime.utcfromtimestamp(time.time())
-        return dt.strftime('%a, %m %b %Y %H:%M:%S GMT')
+        return formatdate(usegmt=True)
+
+    def update_date(self):
+        self.date_header = self.format_header('Date', self.get_date()).encode()
+
+    def tick(self, loop):
+        self.update_date()
+        self.metrics.publish()
+        self.date_timer = loop.call_later(1 - time.time() % 1, self.tick, loop)
+
+    def start_clock(self, loop):
+        self.stop_clock()
+        self.tick(loop)
+
+    def stop_clock(self):
+        if self.date_timer is not None:
+            self.date_timer.cancel()
+            self.date_timer = None
+
+    def get_date_header(self):
+        if self.date_timer is None:
+            self.update_date()
+        return self.date_header
+
+    def format_header(self, header_name, value):
+        return f'{header_name}: {value}\r\n'
+
+    def get_etag(self, stat, encoding=None):
+        suffix = f'-{encoding}' if encoding else ''
+        return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}{suffix}"'
+
+    def get_last_modified(self, stat):
+        return formatdate(stat.st_mtime, usegmt=True)
+
+    def get_validator_headers(self, stat, encoding=None):
+        return (
+            self.format_header('ETag', self.get_etag(stat, encoding))
+            + self.format_header('Last-Modified', self.get_last_modified(stat))
+        )
+
+    def get_entity_headers(self, status_code, content_type, content_length, extra_headers=''):
+        return (
+            self.get_status_headers(status_code)
+            + self.format_header('Content-Type', content_type)
+            + self.format_header('Content-Length', content_length)
+            + extra_headers
+        ).encode()
 
-    def get_server_name(self):
-        return 'Nano HTTP Server - Python/' + sys.version.split()[0]
+    def is_encoding_enabled(self, content_type, size):
+        return self.encoding_cache is not None and is_compressible(content_type, size)
 
-    def add_header(self, header_name, value):
-        self.headers_buffer.append(f'{header_name}: {value}')
+    def get_file_headers(self, content_type, stat):
+        extra_headers = self.format_header('Accept-Ranges', 'bytes') + self.get_validator_headers(stat)
+        if self.is_encoding_enabled(content_type, stat.st_size):
+            extra_headers += self.format_header('Vary', 'Accept-Encoding')
+        return self.get_entity_headers(200, content_type, stat.st_size, extra_headers)
 
-    def get_headers(self, content_type, content_length):
-        self.add_header('Date', self.get_date())
-        self.add_header('Server', self.get_server_name())
-        self.add_header('Connection', 'close')
-        self.add_header('Content-Type', content_type)
-        self.add_header('Content-Length', content_length)
-        headers = '\r\n'.join(self.headers_buffer) + '\r\n\r\n'
-        self.headers_buffer = []
-        return headers
+    def get_file_entity(self, path, stat):
+        key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        entity = self.header_cache.get(key)
+        if entity is None:
+            content_type = self.get_content_type(path)
+            entity = self.header_cache.put(key, (content_type, self.get_file_headers(content_type, stat)))
+        return entity
+
+    def get_encoded_headers(self, content_type, stat, content_length, encoding):
+        extra_headers = (
+            self.format_header('Content-Encoding', encoding)
+            + self.format_header('Vary', 'Accept-Encoding')
+            + self.get_validator_headers(stat, encoding)
+        )
+        return self.get_entity_headers(200, content_type, content_length, extra_headers)
+
+    def get_connection_headers(self, keep_alive):
+        return self.get_date_header() + CONNECTION_HEADERS[keep_alive]
+
+    def get_head(self, entity_headers, keep_alive):
+        return entity_headers + self.get_connection_headers(keep_alive)
 
     def generate_error_message(self, status_code):
         return f'<h1>{MESSAGES[status_code]}</h1>'.encode()
 
-    def get_error_response(self, status_code):
-        status_line = self.get_status_line(status_code)
-        message_body = self.generate_error_message(status_code)
-        headers = self.get_headers('text/html', len(message_body))
-        return (status_line + headers).encode() + message_body
+    def get_error_entity(self, status_code):
+        entity = self.error_headers.get(status_code)
+        if entity is None:
+            message_body = self.generate_error_message(status_code)
+            entity_headers = self.get_entity_headers(status_code, 'text/html', len(message_body))
+            entity = self.error_headers[status_code] = (message_body, entity_headers)
+        return entity
+
+    def get_error_response(self, status_code, keep_alive=False):
+        message_body, entity_headers = self.get_error_entity(status_code)
+        head = self.get_head(entity_headers, keep_alive)
+        return Response(head, message_body, keep_alive=keep_alive)
+
+    def get_status_response(self, method, keep_alive):
+        body = self.metrics.render().encode()
+        extra_headers = self.format_header('Cache-Control', 'no-cache')
+        entity_headers = self.get_entity_headers(200, METRICS_CONTENT_TYPE, len(body), extra_headers)
+        head = self.get_head(entity_headers, keep_alive)
+        if method == 'HEAD':
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, body, keep_alive=keep_alive)
+
+    def get_matched_etag(self, value, stat):
+        if value.strip() == '*':
+            return self.get_etag(stat)
+        etags = {self.get_etag(stat)}
+        etags.update(self.get_etag(stat, encoding) for encoding in ENCODING_EXTENSIONS)
+        for tag in value.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag in etags:
+                return tag
+        return None
+
+    def is_etag_matched(self, value, stat):
+        return self.get_matched_etag(value, stat) is not None
+
+    def is_modified_since(self, value, stat):
+        try:
+            since = parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return True
+        return int(stat.st_mtime) > since
+
+    def get_not_modified_etag(self, headers, stat):
+        # the 304 repeats the tag the client holds, an encoded variant keeps its suffix
+        if 'if-none-match' in headers:
+            return self.get_matched_etag(headers['if-none-match'], stat)
+        if 'if-modified-since' in headers:
+            if not self.is_modified_since(headers['if-modified-since'], stat):
+                return self.get_etag(stat)
+        return None
+
+    def is_range_fresh(self, headers, stat):
+        if_range = headers.get('if-range')
+        if if_range is None:
+            return True
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            return if_range == self.get_etag(stat)
+        return if_range == self.get_last_modified(stat)
+
+    def parse_range(self, value, size):
+        match = REGEXP_RANGE.match(value.strip())
+        if match is None:
+            return None
+        start, end = match.group('start'), match.group('end')
+        if not start:
+            if not end:
+                return None
+            return max(size - int(end), 0), size - 1
+        start = int(start)
+        if end and int(end) < start:
+            return None
+        end = min(int(end), size - 1) if end else size - 1
+        return start, end
+
+    def get_byte_range(self, method, headers, stat):
+        if method != 'GET' or 'range' not in headers:
+            return None
+        if not self.is_range_fresh(headers, stat):
+            return None
+        return self.parse_range(headers['range'], stat.st_size)
+
+    def get_not_modified_response(self, stat, etag, keep_alive):
+        vary = self.format_header('Vary', 'Accept-Encoding') if self.encoding_cache is not None else ''
+        entity_headers = (
+            self.get_status_headers(304)
+            + self.format_header('ETag', etag)
+            + self.format_header('Last-Modified', self.get_last_modified(stat))
+            + vary
+        ).encode()
+        return Response(self.get_head(entity_headers, keep_alive), keep_alive=keep_alive)
 
-    def get_response(self, request):
-        method, uri = self.parse_request(request.decode())
-        if method is None or uri is None:
+    def get_range_not_satisfiable_response(self, stat, keep_alive):
+        message_body = self.generate_error_message(416)
+        extra_headers = self.format_header('Content-Range', f'bytes */{stat.st_size}')
+        entity_headers = self.get_entity_headers(416, 'text/html', len(message_body), extra_headers)
+        head = self.get_head(entity_headers, keep_alive)
+        return Response(head, message_body, keep_alive=keep_alive)
+
+    def get_partial_headers(self, content_type, stat, byte_range):
+        start, end = byte_range
+        extra_headers = (
+            self.format_header('Content-Range', f'bytes {start}-{end}/{stat.st_size}')
+            + self.get_validator_headers(stat)
+        )
+        return self.get_entity_headers(206, content_type, end - start + 1, extra_headers)
+
+    def get_content_response(self, method, entry, stat, byte_range, keep_alive):
+        if byte_range is not None:
+            start, end = byte_range
+            entity_headers = self.get_partial_headers(entry.content_type, stat, byte_range)
+            head = self.get_head(entity_headers, keep_alive)
+            return Response(head, entry.content[start:end + 1], keep_alive=keep_alive)
+        head = self.get_head(entry.headers, keep_alive)
+        if method == 'HEAD':
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, entry.content, keep_alive=keep_alive)
+
+    def get_stream_response(self, method, path, stat, byte_range, keep_alive, **source):
+        content_type, file_headers = self.get_file_entity(path, stat)
+        if byte_range is not None:
+            start, end = byte_range
+            entity_headers = self.get_partial_headers(content_type, stat, byte_range)
+            head = self.get_head(entity_headers, keep_alive)
+            return Response(head, offset=start, count=end - start + 1, keep_alive=keep_alive, **source)
+        head = self.get_head(file_headers, keep_alive)
+        if method == 'HEAD':
+            if source.get('file') is not None:
+                source['file'].close()
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, count=stat.st_size, keep_alive=keep_alive, **source)
+
+    async def get_mapped_response(self, method, path, headers, stat, keep_alive):
+        mapping = await self.mapping_cache.get(path, stat, self.file_io)
+        stat = mapping.stat
+        byte_range = self.get_byte_range(method, headers, stat)
+        if byte_range is not None and byte_range[0] >= stat.st_size:
+            return self.get_range_not_satisfiable_response(stat, keep_alive)
+        return self.get_stream_response(method, path, stat, byte_range, keep_alive, mapping=mapping)
+
+    async def load_cache_entry(self, path):
+        content, stat = await self.file_io.read(path)
+        content_type, entity_headers = self.get_file_entity(path, stat)
+        return self.cache.put(path, stat, content, entity_headers, content_type)
+
+    async def get_cached_response(self, method, path, headers, stat, keep_alive):
+        entry = self.cache.get(path, stat)
+        if entry is None:
+            if not self.cache.is_cacheable(stat.st_size):
+                return None
+            entry = await self.load_cache_entry(path)
+            if entry is None:
+                return None
+        byte_range = self.get_byte_range(method, headers, stat)
+        if byte_range is not None and byte_range[0] >= stat.st_size:
+            return self.get_range_not_satisfiable_response(stat, keep_alive)
+        return self.get_content_response(method, entry, stat, byte_range, keep_alive)
+
+    async def get_precompressed_response(self, method, path, encoding, content_type, stat,
+                                        keep_alive):
+        sibling = path + ENCODING_EXTENSIONS[encoding]
+        try:
+            sibling_stat = await self.file_io.stat(sibling)
+        except OSError:
+            return None
+        if not stat_module.S_ISREG(sibling_stat.st_mode) or sibling_stat.st_mtime < stat.st_mtime:
+            return None
+        f, sibling_stat = await self.file_io.open(sibling)
+        entity_headers = self.get_encoded_headers(content_type, stat, sibling_stat.st_size, encoding)
+        head = self.get_head(entity_headers, keep_alive)
+        if method == 'HEAD':
+            f.close()
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, file=f, count=sibling_stat.st_size, keep_alive=keep_alive)
+
+    async def get_compressed_entry(self, path, encoding, content_type, stat):
+        key = (path, encoding)
+        entry = self.encoding_cache.get(key, stat)
+        if entry is not None:
+            return entry
+        content, stat = await self.file_io.read(path)
+        loop = asyncio.get_running_loop()
+        compressed = await loop.run_in_executor(self.executor, compress, encoding, content)
+        entity_headers = self.get_encoded_headers(content_type, stat, len(compressed), encoding)
+        entry = self.encoding_cache.put(key, stat, compressed, entity_headers, content_type)
+        if entry is None:
+            entry = CacheEntry(
+                compressed, entity_headers, content_type,
+                stat.st_mtime_ns, stat.st_size, stat.st_ino
+            )
+        return entry
+
+    async def get_encoded_response(self, method, path, headers, stat, keep_alive):
+        accepted = parse_accept_encoding(headers.get('accept-encoding', ''))
+        if not accepted:
+            return None
+        content_type = self.get_content_type(path)
+        # images and archives are not worth the stat of their .br and .gz siblings
+        if not is_compressible(content_type):
+            return None
+        for encoding in accepted:
+            response = await self.get_precompressed_response(
+                method, path, encoding, content_type, stat, keep_alive
+            )
+            if response is not None:
+                return response
+        if not is_compressible(content_type, stat.st_size):
+            return None
+        for encoding in accepted:
+            if encoding in COMPRESSORS:
+                entry = await self.get_compressed_entry(path, encoding, content_type, stat)
+                return self.get_content_response(method, entry, stat, None, keep_alive)
+        return None
+
+    async def get_file_response(self, method, path, headers, keep_alive):
+        stat = await self.file_io.stat(path)
+        if stat_module.S_ISDIR(stat.st_mode):
+            raise IsADirectoryError(path)
+        etag = self.get_not_modified_etag(headers, stat)
+        if etag is not None:
+            return self.get_not_modified_response(stat, etag, keep_alive)
+        if self.encoding_cache is not None and 'range' not in headers:
+            response = await self.get_encoded_response(method, path, headers, stat, keep_alive)
+            if response is not None:
+                return response
+        if self.cache is not None:
+            response = await self.get_cached_response(method, path, headers, stat, keep_alive)
+            if response is not None:
+                return response
+        if self.mapping_cache is not None and stat.st_size > 0:
+            return await self.get_mapped_response(method, path, headers, stat, keep_alive)
+        f, stat = await self.file_io.open(path)
+        byte_range = self.get_byte_range(method, headers, stat)
+        if byte_range is not None and byte_range[0] >= stat.st_size:
+            f.close()
+            return self.get_range_not_satisfiable_response(stat, keep_alive)
+        return self.get_stream_response(method, path, stat, byte_range, keep_alive, file=f)
+
+    def is_directory_uri(self, uri):
+        return self.directory_index is not None and (not uri or uri.endswith('/'))
+
+    async def get_directory_response(self, method, path, uri, query, keep_alive):
+        stat = await self.file_io.stat(path)
+        if not stat_module.S_ISDIR(stat.st_mode):
+            raise NotADirectoryError(path)
+        body = await self.directory_index.get_page(
+            path, stat, '/' + uri, get_page_number(query), self.file_io
+        )
+        if body is None:
+            return self.get_error_response(404, keep_alive)
+        entity_headers = self.get_entity_headers(200, LISTING_CONTENT_TYPE, len(body))
+        head = self.get_head(entity_headers, keep_alive)
+        if method == 'HEAD':
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, body, keep_alive=keep_alive)
+
+    def has_body(self, status_code):
+        return status_code >= 200 and status_code not in BODILESS_STATUSES
+
+    def get_app_head(self, method, status_code, app_response, keep_alive):
+        status, headers, body = app_response
+        head = f'HTTP/1.1 {status}\r\nServer: {SERVER_NAME}\r\n'
+        content_length = len(body)
+        for name, value in headers:
+            name_lower = name.lower()
+            if name_lower == 'content-length':
+                if method == 'HEAD':
+                    content_length = value
+            elif name_lower not in APP_SKIPPED_HEADERS:
+                head += self.format_header(name, value)
+        if self.has_body(status_code):
+            head += self.format_header('Content-Length', content_length)
+        return head.encode('latin-1') + self.get_connection_headers(keep_alive)
+
+    async def get_app_response(self, request, path, query, keep_alive):
+        try:
+            app_response = await self.app_host.call(request, path, query)
+            status_code = int(app_response.status[:3])
+            head = self.get_app_head(request.method, status_code, app_response, keep_alive)
+        except Exception:
+            logging.exception(f'Application failed on {request.method} {request.uri}')
+            return self.get_error_response(500, keep_alive)
+        if request.method == 'HEAD' or not self.has_body(status_code):
+            return Response(head, keep_alive=keep_alive)
+        return Response(head, app_response.body, keep_alive=keep_alive)
+
+    def is_body_too_large(self, headers):
+        return get_content_length(headers) > self.max_body_size
+
+    async def get_request_response(self, request, keep_alive_allowed):
+        method, headers = request.method, request.headers
+        keep_alive = keep_alive_allowed and self.is_keep_alive(request.version, headers)
+        if self.is_body_too_large(headers):
+            return self.get_error_response(413)
+        if request.body is None:
             return self.get_error_response(400)
-        full_uri = self.get_full_uri(uri)
+        if 'transfer-encoding' in headers:
+            return self.get_error_response(411)
+        path, _, query = request.uri.partition('?')
+        if self.app_host is not None and self.app_host.is_mounted(path):
+            return await self.get_app_response(request, path, query, keep_alive)
         if method not in ALLOWED_METHODS:
-            return self.get_error_response(405)
+            return self.get_error_response(405, keep_alive)
+        if path == STATUS_PATH:
+            return self.get_status_response(method, keep_alive)
+        uri = self.process_uri(request.uri)
+        full_uri = self.get_full_uri(uri)
         if not self.is_uri_safe(full_uri):
-            return self.get_error_response(403)
+            return self.get_error_response(403, keep_alive)
         try:
-            message_body = self.get_file_content(full_uri)
+            return await self.get_file_response(method, full_uri, headers, keep_alive)
         except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
-            return self.get_error_response(404)
-        headers = self.get_headers(self.get_content_type(full_uri), len(message_body))
-        status_line = self.get_status_line(200)
-        if method == 'HEAD':
-            return (status_line + headers).encode()
-        return (status_line + headers).encode() + message_body
+            if not self.is_directory_uri(uri):
+                return self.get_error_response(404, keep_alive)
+        try:
+            return await self.get_directory_response(
+                method, os.path.dirname(full_uri), uri, query, keep_alive
+            )
+        except (FileNotFoundError, NotADirectoryError):
+            return self.get_error_response(404, keep_alive)
+        except PermissionError:
+            return self.get_error_response(403, keep_alive)
+
+    async def get_response(self, data, keep_alive_allowed=False):
+        started = time.perf_counter()
+        request = parse_request(data)
+        parsed = time.perf_counter()
+        self.metrics.parse.observe(parsed - started)
+        if request is None:
+            return self.get_error_response(400)
+        response = await self.get_request_response(request, keep_alive_allowed)
+        # routing, file lookup and reading, compression or the application call
+        self.metrics.handle.observe(time.perf_counter() - parsed)
+        return response
@@ -1,69 +1,348 @@
+import os
 import asyncio
+import time
+import signal
 import socket
+import logging
 import concurrent.futures
-from .request_handler import AsyncRequestHandler
-from multiprocessing import Process
+from .request_handler import AsyncRequestHandler, MESSAGES
+from .cache import FileCache, MAX_CACHED_FILE_SIZE
+from .compression import MAX_COMPRESS_SIZE
+from .fileio import AsyncFileIO, IO_THREADS, SENDFILE_CHUNK_SIZE
+from .master import Master, GRACEFUL_TIMEOUT
+from .metrics import Metrics, MetricsStore
+from .autoindex import DirectoryIndex, AUTOINDEX_PAGE_SIZE
+from .mapping import MappingCache, MAX_MAPPINGS
+from .parser import RequestReader, MAX_BODY_LEN, CONTINUE_RESPONSE
+from .app import create_app_host, APP_PREFIX, APP_THREADS
 
 
-TIMEOUT_RECV = 10
-MAX_MESSAGE_LEN = 10240
+TIMEOUT_HEADERS = 10
+TIMEOUT_KEEP_ALIVE = 5
+MAX_KEEP_ALIVE_REQUESTS = 100
+MAX_CONNECTIONS = 1024
+ACCEPT_BATCH = 16
+ACCEPT_ERROR_DELAY = 0.1
+RECV_SIZE = 1024
+MAX_RECV_SIZE = 256 * 1024
 
 
 class AsyncServer:
 
-    def __init__(self, root, sock, loop):
-        self.request_handler = AsyncRequestHandler(root)
+    def __init__(self, root, sock, loop, keep_alive_timeout=TIMEOUT_KEEP_ALIVE,
+                max_requests=MAX_KEEP_ALIVE_REQUESTS, cache_size=0,
+                cache_file_size=MAX_CACHED_FILE_SIZE, compress=False,
+                compress_cache_size=0, io_threads=IO_THREADS,
+                graceful_timeout=GRACEFUL_TIMEOUT, autoindex=False,
+                autoindex_page_size=AUTOINDEX_PAGE_SIZE, max_connections=MAX_CONNECTIONS,
+                header_timeout=TIMEOUT_HEADERS, use_mmap=False, max_mappings=MAX_MAPPINGS,
+                app=None, app_prefix=APP_PREFIX, app_interface='auto', app_threads=APP_THREADS,
+                app_path=None, max_body_size=MAX_BODY_LEN):
+        self.cache = FileCache(cache_size, cache_file_size) if cache_size > 0 else None
+        self.encoding_cache = FileCache(compress_cache_size, MAX_COMPRESS_SIZE) if compress else None
+        self.executor = concurrent.futures.ThreadPoolExecutor()
+        self.file_io = AsyncFileIO(io_threads)
+        self.metrics = Metrics(MESSAGES)
+        self.directory_index = DirectoryIndex(autoindex_page_size) if autoindex else None
+        self.mapping_cache = MappingCache(max_mappings) if use_mmap else None
+        self.app_host = create_app_host(
+            app, app_prefix, app_interface, sock.getsockname(), app_threads, app_path
+        ) if app is not None else None
+        self.max_body_size = max_body_size
+        self.request_handler = AsyncRequestHandler(
+            root, self.cache, self.encoding_cache, self.executor, self.file_io, self.metrics,
+            self.directory_index, self.mapping_cache, self.app_host, max_body_size
+        )
         self.loop = loop
         self.sock = sock
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self.sendfile_supported = True
+        self.graceful_timeout = graceful_timeout
+        self.max_connections = max_connections
+        self.header_timeout = header_timeout
+        self.closing = False
+        self.closed = asyncio.Event()
+        self.accept_task = None
+        self.accept_paused = False
+        self.can_accept = asyncio.Event()
+        self.can_accept.set()
+        self.connections = set()
+        self.idle_connections = set()
+
+    async def accept(self):
+        await self.can_accept.wait()
+        return await self.loop.sock_accept(self.sock)
 
     async def connect(self):
-        while True:
-            client_socket, _ = await self.loop.sock_accept(self.sock)
-            handler = self.handle(client_socket)
-            self.loop.create_task(handler)
+        while not self.closing:
+            self.accept_task = self.loop.create_task(self.accept())
+            try:
+                client_socket, _ = await self.accept_task
+            except asyncio.CancelledError:
+                break
+            except OSError as e:
+                logging.warning(f'Accept failed: {e}')
+                await asyncio.sleep(ACCEPT_ERROR_DELAY)
+                continue
+            self.start_connection(client_socket)
+            self.accept_backlog()
+
+    def accept_backlog(self):
+        for _ in range(ACCEPT_BATCH - 1):
+            if self.accept_paused or self.closing:
+                return
+            try:
+                client_socket, _ = self.sock.accept()
+            except OSError:
+                return
+            client_socket.setblocking(False)
+            self.start_connection(client_socket)
+
+    def start_connection(self, client_socket):
+        accepted = time.perf_counter()
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.add_connection(self.loop.create_task(self.handle(client_socket, accepted)))
+
+    def stop_accepting(self):
+        if self.accept_task is not None and not self.accept_task.done():
+            self.accept_task.cancel()
+
+    def pause_accepting(self):
+        self.can_accept.clear()
+
+    def resume_accepting(self):
+        self.can_accept.set()
+
+    def add_connection(self, task):
+        self.connections.add(task)
+        task.add_done_callback(self.remove_connection)
+        if len(self.connections) >= self.max_connections and not self.accept_paused:
+            self.accept_paused = True
+            self.metrics.count('accept_pauses')
+            self.pause_accepting()
+
+    def remove_connection(self, task):
+        self.connections.discard(task)
+        if self.accept_paused and len(self.connections) < self.max_connections:
+            self.accept_paused = False
+            if not self.closing:
+                self.resume_accepting()
+
+    def set_idle(self, idle):
+        task = asyncio.current_task()
+        if idle:
+            self.idle_connections.add(task)
+        else:
+            self.idle_connections.discard(task)
+
+    def close(self):
+        self.closing = True
+        self.closed.set()
+
+    async def drain(self):
+        for task in self.idle_connections:
+            task.cancel()
+        if self.connections:
+            await asyncio.wait(self.connections, timeout=self.graceful_timeout)
+        for task in self.connections:
+            task.cancel()
+
+    async def serve(self):
+        self.request_handler.start_clock(self.loop)
+        connect_task = self.loop.create_task(self.connect())
+        await self.closed.wait()
+        self.stop_accepting()
+        await connect_task
+        await self.drain()
+        self.request_handler.stop_clock()
+
+    def can_keep_alive(self, served):
+        return not self.closing and self.keep_alive_timeout > 0 and served < self.max_requests
 
-    async def sock_recvall(self, sock, size):
-        tmp = bytearray()
-        received = 0
+    async def sock_recvall(self, sock, size, reader, timeout):
+        deadline = self.loop.time() + (self.header_timeout if reader else timeout)
         while True:
+            request = reader.next_request()
+            if request is not None:
+                return request
+            if reader.is_overflow():
+                break
+            if reader.is_continue_expected():
+                await self.loop.sock_sendall(sock, CONTINUE_RESPONSE)
             try:
-                chunk = await asyncio.wait_for(self.loop.sock_recv(sock, size), TIMEOUT_RECV)
+                chunk = await asyncio.wait_for(
+                    self.loop.sock_recv(sock, max(size, min(reader.pending(), MAX_RECV_SIZE))),
+                    deadline - self.loop.time()
+                )
             except concurrent.futures.TimeoutError:
+                if reader:
+                    self.metrics.count('header_timeouts')
                 break
             if not chunk:
                 break
-            received += len(chunk)
-            if received > MAX_MESSAGE_LEN:
-                break
-            tmp.extend(chunk)
-            if b'\r\n\r\n' in tmp:
+            if not reader:
+                deadline = self.loop.time() + self.header_timeout
+            reader.feed(chunk)
+        return reader.flush() or None
+
+    def sendfile_nowait(self, sock, f, offset, count):
+        # a range that fits into the socket buffer is sent at once, without the
+        # writability wait and the epoll registration of the loop's sendfile
+        try:
+            return os.sendfile(sock.fileno(), f.fileno(), offset, count)
+        except (BlockingIOError, InterruptedError):
+            return 0
+
+    async def send_file(self, sendfile, send, f, offset, count, sock=None):
+        while count > 0 and self.sendfile_supported:
+            size = min(count, SENDFILE_CHUNK_SIZE)
+            await self.file_io.prefetch(f, offset, size)
+            if sock is not None:
+                sent = self.sendfile_nowait(sock, f, offset, size)
+                offset += sent
+                count -= sent
+                size -= sent
+                if not size:
+                    continue
+            try:
+                await sendfile(f, offset, size)
+            except NotImplementedError:
+                self.sendfile_supported = False
                 break
-        return tmp
+            offset += size
+            count -= size
+        async for chunk in self.file_io.iter_chunks(f, offset, count):
+            await send(chunk)
+
+    async def sock_sendfile(self, sock, f, offset, count):
+        await self.send_file(
+            lambda *args: self.loop.sock_sendfile(sock, *args),
+            lambda chunk: self.loop.sock_sendall(sock, chunk),
+            f, offset, count, sock
+        )
+
+    async def sock_sendmapping(self, sock, mapping, offset, count):
+        for chunk in mapping.iter_chunks(offset, count):
+            await self.loop.sock_sendall(sock, chunk)
+
+    async def send_response(self, sock, response):
+        try:
+            await self.loop.sock_sendall(sock, response.head + response.body)
+            if response.mapping is not None:
+                await self.sock_sendmapping(sock, response.mapping, response.offset, response.count)
+            elif response.file is not None and response.count:
+                await self.sock_sendfile(sock, response.file, response.offset, response.count)
+        finally:
+            if response.file is not None:
+                response.file.close()
 
-    async def handle(self, client_socket):
-        request = await self.sock_recvall(client_socket, 1024)
-        response = self.request_handler.get_response(request)
-        await self.loop.sock_sendall(client_socket, response)
-        client_socket.close()
+    async def handle(self, client_socket, accepted):
+        self.metrics.count_connection(time.perf_counter() - accepted)
+        reader = RequestReader(max_body_len=self.max_body_size)
+        timeout = self.header_timeout
+        served = 0
+        try:
+            while True:
+                self.set_idle(served > 0 and not reader)
+                try:
+                    request = await self.sock_recvall(client_socket, RECV_SIZE, reader, timeout)
+                finally:
+                    self.set_idle(False)
+                if request is None:
+                    break
+                served += 1
+                response = await self.request_handler.get_response(
+                    request, self.can_keep_alive(served)
+                )
+                started = time.perf_counter()
+                await self.send_response(client_socket, response)
+                self.metrics.count_response(response, time.perf_counter() - started)
+                if not response.keep_alive or self.closing:
+                    break
+                timeout = self.keep_alive_timeout
+        except OSError as e:
+            log_connection_error(e)
+        finally:
+            client_socket.close()
 
 
-def create_socket(addr, port):
+def log_connection_error(error):
+    # a reset by the client is routine, anything else, e.g. EFAULT
+    # when a mapped file is truncated while it is sent, is worth a line
+    if not isinstance(error, ConnectionError):
+        logging.warning(f'Connection failed: {error}')
+
+
+def create_socket(addr, port, reuse_port=False, listen=True):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     sock.bind((addr, port))
-    sock.listen()
+    if listen:
+        sock.listen()
     sock.setblocking(False)
     return sock
 
 
-def run_server(root, sock):
-    loop = asyncio.get_event_loop()
-    serv = AsyncServer(root, sock, loop)
-    loop.create_task(serv.connect())
-    loop.run_forever()
+def create_worker_sockets(sock, workers, reuse_port):
+    if not reuse_port:
+        return [sock]
+    addr, port = sock.getsockname()[:2]
+    sockets = [create_socket(addr, port, reuse_port=True) for _ in range(workers)]
+    sock.close()
+    return sockets
+
+
+def create_event_loop(use_uvloop):
+    if use_uvloop:
+        try:
+            import uvloop
+            return uvloop.new_event_loop()
+        except ImportError:
+            logging.warning('uvloop is not installed, falling back to asyncio event loop')
+    return asyncio.new_event_loop()
+
+
+def reset_signal_handlers():
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def run_server(root, sock, server_class=AsyncServer, use_uvloop=False,
+               ready=None, metrics_store=None, slot=None, **server_options):
+    reset_signal_handlers()
+    loop = create_event_loop(use_uvloop)
+    asyncio.set_event_loop(loop)
+    serv = server_class(root, sock, loop, **server_options)
+    if metrics_store is not None:
+        serv.metrics.attach(metrics_store, slot)
+    loop.add_signal_handler(signal.SIGTERM, serv.close)
+    if ready is not None:
+        loop.call_soon(ready.set)
+    try:
+        loop.run_until_complete(serv.serve())
+    finally:
+        loop.close()
 
 
-def serve_forever(root, sock, workers):
-    for i in range(workers):
-        p = Process(target=run_server, args=(root, sock))
-        p.start()
+def serve_forever(root, sock, workers, server_class=AsyncServer, reuse_port=False,
+                  use_uvloop=False, **server_options):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s] %(levelname).1s %(message)s',
+        datefmt='%Y.%m.%d %H:%M:%S'
+    )
+    master = Master(
+        run_server,
+        (root,),
+        {'server_class': server_class, 'use_uvloop': use_uvloop, **server_options},
+        workers,
+        server_options.get('graceful_timeout', GRACEFUL_TIMEOUT),
+        MetricsStore(workers * 2, len(Metrics(MESSAGES))),
+        create_worker_sockets(sock, workers, reuse_port)
+    )
+    master.run()
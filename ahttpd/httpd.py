@@ -1,5 +1,13 @@
 import argparse
-from ahttp.server import create_socket, serve_forever
+from ahttp.server import AsyncServer, create_socket, serve_forever
+from ahttp.protocol import ProtocolServer
+from ahttp.app import APP_INTERFACES, check_app
+
+
+SERVER_CORES = {
+    'socket': AsyncServer,
+    'protocol': ProtocolServer
+}
 
 
 def get_cmd_args():
@@ -8,15 +16,140 @@ def get_cmd_args():
     parser.add_argument('-a', '--addr', type=str, default='0.0.0.0', help='Server address')
     parser.add_argument('-p', '--port', type=int, default=8000, help='Server port')
     parser.add_argument('-w', '--workers', type=int, default=2, help='Number of workers')
-    return parser.parse_args()
+    parser.add_argument(
+        '-k', '--keep_alive_timeout', type=float, default=5,
+        help='Keep-alive idle timeout in seconds, 0 disables keep-alive'
+    )
+    parser.add_argument(
+        '-m', '--max_requests', type=int, default=100,
+        help='Max number of requests per keep-alive connection'
+    )
+    parser.add_argument(
+        '-c', '--cache_size', type=int, default=0,
+        help='File cache size in bytes per worker, 0 disables the cache'
+    )
+    parser.add_argument(
+        '--cache_file_size', type=int, default=1024 * 1024,
+        help='Max size in bytes of a file kept in the cache'
+    )
+    parser.add_argument(
+        '-z', '--compress', action='store_true',
+        help='Enable gzip/brotli content encoding'
+    )
+    parser.add_argument(
+        '--compress_cache_size', type=int, default=16 * 1024 * 1024,
+        help='Compressed variants cache size in bytes per worker'
+    )
+    parser.add_argument(
+        '-t', '--io_threads', type=int, default=4,
+        help='Number of file I/O threads per worker, 0 runs file I/O in the event loop'
+    )
+    parser.add_argument(
+        '--core', choices=SERVER_CORES, default='socket',
+        help='Server core: low-level socket calls or asyncio.Protocol transports'
+    )
+    parser.add_argument(
+        '--reuse_port', action='store_true',
+        help='Give every worker a separate SO_REUSEPORT listening socket'
+    )
+    parser.add_argument(
+        '--uvloop', action='store_true',
+        help='Use uvloop event loop if it is installed'
+    )
+    parser.add_argument(
+        '-g', '--graceful_timeout', type=float, default=30,
+        help='Time in seconds given to workers to finish in-flight requests on shutdown'
+    )
+    parser.add_argument(
+        '-i', '--autoindex', action='store_true',
+        help='List directories that have no index.html'
+    )
+    parser.add_argument(
+        '--autoindex_page_size', type=int, default=1000,
+        help='Max number of entries on one directory listing page'
+    )
+    parser.add_argument(
+        '-l', '--max_connections', type=int, default=1024,
+        help='Max number of open connections per worker, accept is paused above it'
+    )
+    parser.add_argument(
+        '--header_timeout', type=float, default=10,
+        help='Time in seconds given to a client to send the whole request head'
+    )
+    parser.add_argument(
+        '--mmap', action='store_true',
+        help='Serve files from memory mappings shared by all connections of a worker'
+    )
+    parser.add_argument(
+        '--mmap_cache_size', type=int, default=256,
+        help='Max number of memory-mapped files kept open per worker'
+    )
+    parser.add_argument(
+        '--app', type=str, default=None,
+        help='WSGI or ASGI application to mount, as module:callable'
+    )
+    parser.add_argument(
+        '--app_prefix', type=str, default='/app',
+        help='URL prefix the application is mounted at'
+    )
+    parser.add_argument(
+        '--app_interface', choices=APP_INTERFACES, default='auto',
+        help='Application interface, auto detects ASGI by a coroutine callable'
+    )
+    parser.add_argument(
+        '--app_threads', type=int, default=8,
+        help='Number of threads per worker running a WSGI application'
+    )
+    parser.add_argument(
+        '--app_path', type=str, default='.',
+        help='Directory added to sys.path to import the application from'
+    )
+    parser.add_argument(
+        '--max_body_size', type=int, default=1024 * 1024,
+        help='Max size in bytes of a request body'
+    )
+    cmd_args = parser.parse_args()
+    if cmd_args.app is not None:
+        error = check_app(cmd_args.app, cmd_args.app_path)
+        if error is not None:
+            parser.error(f'cannot load application {cmd_args.app}: {error}')
+    return cmd_args
 
 
 if __name__ == '__main__':
 
     cmd_args = get_cmd_args()
-    sock = create_socket(cmd_args.addr, cmd_args.port)
+    sock = create_socket(
+        cmd_args.addr,
+        cmd_args.port,
+        reuse_port=cmd_args.reuse_port,
+        listen=not cmd_args.reuse_port
+    )
     serve_forever(
         cmd_args.root,
-        sock, 
-        cmd_args.workers
+        sock,
+        cmd_args.workers,
+        SERVER_CORES[cmd_args.core],
+        reuse_port=cmd_args.reuse_port,
+        use_uvloop=cmd_args.uvloop,
+        keep_alive_timeout=cmd_args.keep_alive_timeout,
+        max_requests=cmd_args.max_requests,
+        cache_size=cmd_args.cache_size,
+        cache_file_size=cmd_args.cache_file_size,
+        compress=cmd_args.compress,
+        compress_cache_size=cmd_args.compress_cache_size,
+        io_threads=cmd_args.io_threads,
+        graceful_timeout=cmd_args.graceful_timeout,
+        autoindex=cmd_args.autoindex,
+        autoindex_page_size=cmd_args.autoindex_page_size,
+        max_connections=cmd_args.max_connections,
+        header_timeout=cmd_args.header_timeout,
+        use_mmap=cmd_args.mmap,
+        max_mappings=cmd_args.mmap_cache_size,
+        app=cmd_args.app,
+        app_prefix=cmd_args.app_prefix,
+        app_interface=cmd_args.app_interface,
+        app_threads=cmd_args.app_threads,
+        app_path=cmd_args.app_path,
+        max_body_size=cmd_args.max_body_size
     )
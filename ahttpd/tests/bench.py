@@ -0,0 +1,199 @@
+import asyncio
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from itertools import chain
+from urllib.parse import quote
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTENT_DIR = 'httptest'
+SIZE_CLASSES = {
+    'small': (0, 10 * 1024),
+    'medium': (10 * 1024, 100 * 1024),
+    'large': (100 * 1024, float('inf'))
+}
+PERCENTILES = (50, 95, 99)
+
+REGEXP_STATUS = re.compile(rb'HTTP/\d\.\d (\d{3})')
+REGEXP_CONTENT_LENGTH = re.compile(rb'Content-Length: (\d+)', re.IGNORECASE)
+REGEXP_CONNECTION_CLOSE = re.compile(rb'Connection: close', re.IGNORECASE)
+
+
+def build_request(host, path, keep_alive):
+    connection = 'keep-alive' if keep_alive else 'close'
+    return (
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: {host}\r\n'
+        f'Connection: {connection}\r\n\r\n'
+    ).encode()
+
+
+def get_size_class(size):
+    for name, (low, high) in SIZE_CLASSES.items():
+        if low <= size < high:
+            return name
+
+
+def find_files(root, content_dir=CONTENT_DIR):
+    files = {name: [] for name in SIZE_CLASSES}
+    for dirpath, _, filenames in os.walk(os.path.join(root, content_dir)):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            uri = '/' + quote(os.path.relpath(path, root).replace(os.sep, '/'))
+            files[get_size_class(os.path.getsize(path))].append(uri)
+    return files
+
+
+def parse_mix(value):
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.partition(':')
+        if name not in SIZE_CLASSES:
+            raise argparse.ArgumentTypeError(f'unknown size class: {name}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def choose_paths(files, weights, count, seed=None):
+    classes = [name for name in weights if files[name]]
+    if not classes:
+        raise ValueError('No files found for the requested size classes')
+    rnd = random.Random(seed)
+    chosen = rnd.choices(classes, [weights[name] for name in classes], k=count)
+    return [rnd.choice(files[name]) for name in chosen]
+
+
+async def read_response(reader):
+    headers = await reader.readuntil(b'\r\n\r\n')
+    match = REGEXP_CONTENT_LENGTH.search(headers)
+    length = int(match.group(1)) if match else 0
+    if length:
+        await reader.readexactly(length)
+    status = REGEXP_STATUS.match(headers)
+    status = int(status.group(1)) if status else 0
+    return status, length, REGEXP_CONNECTION_CLOSE.search(headers) is None
+
+
+async def client(host, port, paths, keep_alive, stats):
+    reader = writer = None
+    while stats['left'] > 0:
+        stats['left'] -= 1
+        path = paths[stats['left'] % len(paths)]
+        reused = writer is not None
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(build_request(host, path, keep_alive))
+            status, length, keep_open = await read_response(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if writer is not None:
+                writer.close()
+            writer = None
+            if reused:
+                # the server closed an idle keep-alive connection, the request is sent again
+                stats['left'] += 1
+                stats['reconnects'] += 1
+            else:
+                stats['errors'] += 1
+            continue
+        stats['latencies'].append(time.perf_counter() - started)
+        stats['statuses'][status] += 1
+        stats['bytes'] += length
+        if not keep_open:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(host, port, paths, requests, concurrency, keep_alive):
+    stats = {
+        'left': requests, 'errors': 0, 'reconnects': 0, 'bytes': 0,
+        'latencies': [], 'statuses': Counter()
+    }
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, paths, keep_alive, stats) for _ in range(concurrency)
+    ))
+    stats['elapsed'] = time.perf_counter() - started
+    del stats['left']
+    return stats
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def summarize(results, **params):
+    latencies = sorted(chain.from_iterable(result['latencies'] for result in results))
+    statuses = sum((result['statuses'] for result in results), Counter())
+    return {
+        **params,
+        'requests': len(latencies),
+        'errors': sum(result['errors'] for result in results),
+        'reconnects': sum(result['reconnects'] for result in results),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'bytes': sum(result['bytes'] for result in results),
+        'rps': round(sum(len(result['latencies']) / result['elapsed'] for result in results), 2),
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES},
+            'max': round(latencies[-1] * 1000, 3) if latencies else 0.0
+        }
+    }
+
+
+def get_paths(args):
+    if args.mix is None:
+        return args.path or ['/httptest/dir2/page.html']
+    return choose_paths(find_files(args.root), args.mix, args.requests, args.seed)
+
+
+def add_client_args(parser):
+    parser.add_argument('-a', '--addr', type=str, default='127.0.0.1', help='Server address')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='Server port')
+    parser.add_argument('-u', '--path', type=str, action='append', help='Path to request, repeatable')
+    parser.add_argument('-n', '--requests', type=int, default=10000)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('-r', '--root', type=str, default=TESTS_DIR,
+                        help='Local copy of the server root, used to build the --mix')
+    parser.add_argument('--mix', type=parse_mix,
+                        help='Weighted size classes of files under httptest, e.g. small:70,medium:25,large:5')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the --mix')
+
+
+def get_cmd_args():
+    parser = argparse.ArgumentParser(description='HTTP load generator, prints results as JSON')
+    add_client_args(parser)
+    parser.add_argument('-k', '--keep_alive', choices=['on', 'off', 'both'], default='both')
+    parser.add_argument('-o', '--output', type=str, help='Write JSON results to the file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = get_cmd_args()
+    paths = get_paths(args)
+    modes = {'on': [True], 'off': [False], 'both': [False, True]}[args.keep_alive]
+    results = []
+    for keep_alive in modes:
+        stats = asyncio.run(run(
+            args.addr, args.port, paths,
+            args.requests, args.concurrency, keep_alive
+        ))
+        results.append(summarize(
+            [stats], keep_alive=keep_alive, concurrency=args.concurrency,
+            paths=len(set(paths)), mix=args.mix
+        ))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import cProfile
+import os
+import pstats
+import time
+from ahttp.cache import FileCache
+from ahttp.request_handler import AsyncRequestHandler
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST = (
+    b'GET /httptest/dir2/page.html HTTP/1.1\r\n'
+    b'Host: localhost:8000\r\n'
+    b'Connection: keep-alive\r\n\r\n'
+)
+
+
+async def handle(handler, number):
+    handler.start_clock(asyncio.get_running_loop())
+    for _ in range(number):
+        response = await handler.get_response(REQUEST, keep_alive_allowed=True)
+        if response.file is not None:
+            response.file.close()
+    handler.stop_clock()
+
+
+def run(handler, number, profile):
+    profiler = cProfile.Profile() if profile else None
+    started = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    asyncio.run(handle(handler, number))
+    if profiler is not None:
+        profiler.disable()
+    elapsed = time.perf_counter() - started
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('tottime').print_stats(15)
+    return elapsed / number * 1e6
+
+
+def get_cmd_args():
+    parser = argparse.ArgumentParser(description='Time AsyncRequestHandler.get_response for a small file')
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    parser.add_argument('-c', '--cache_size', type=int, default=0, help='File cache size in bytes')
+    parser.add_argument('--profile', action='store_true', help='Print a cProfile report')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = get_cmd_args()
+    cache = FileCache(args.cache_size, args.cache_size) if args.cache_size else None
+    handler = AsyncRequestHandler(TESTS_DIR, cache=cache)
+    usec = run(handler, args.number, args.profile)
+    print(f'get_response: {usec:.2f} us/request')
@@ -0,0 +1,83 @@
+import argparse
+import re
+import timeit
+from ahttp.parser import RequestReader, parse_request
+
+
+REGEXP_REQUEST = re.compile(
+    r'(?P<method>(GET|HEAD)) (?P<uri>[^\r\n]+) HTTP\/(?P<version>\d\.\d)\r\n(?P<headers>.*)',
+    re.DOTALL
+)
+REQUEST = (
+    b'GET /httptest/wikipedia_russia_files/220px-Moscow_City_May_2010_03.JPG HTTP/1.1\r\n'
+    b'Host: localhost:8000\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:60.0) Gecko/20100101 Firefox/60.0\r\n'
+    b'Accept: image/webp,*/*\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Accept-Encoding: gzip, deflate, br\r\n'
+    b'Referer: http://localhost:8000/httptest/wikipedia_russia.html\r\n'
+    b'Connection: keep-alive\r\n'
+    b'If-Modified-Since: Fri, 21 Aug 2020 16:23:17 GMT\r\n\r\n'
+)
+LARGE_REQUEST = REQUEST[:-2] + b'Cookie: ' + b'x' * 8000 + b'\r\n\r\n'
+
+
+def regex_parse_request(data):
+    match = REGEXP_REQUEST.match(data.decode(errors='replace'))
+    if match is None:
+        return None
+    groups = match.groupdict()
+    headers = {}
+    for line in groups['headers'].split('\r\n'):
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return groups['method'], groups['uri'], groups['version'], headers
+
+
+def rescan_read(chunks):
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        end = buffer.find(b'\r\n\r\n')
+        if end != -1:
+            request = bytes(buffer[:end + 4])
+            del buffer[:end + 4]
+            return request
+
+
+def incremental_read(chunks):
+    reader = RequestReader()
+    for chunk in chunks:
+        reader.feed(chunk)
+        request = reader.next_request()
+        if request is not None:
+            return request
+
+
+def get_chunks(request, chunk_size):
+    return [request[i:i + chunk_size] for i in range(0, len(request), chunk_size)]
+
+
+def report(name, func, number):
+    elapsed = min(timeit.repeat(func, number=number, repeat=5))
+    print(f'{name:<44} {elapsed / number * 1e6:8.2f} us')
+
+
+def get_cmd_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    parser.add_argument('-s', '--chunk_size', type=int, default=64, help='Bytes per recv() chunk')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = get_cmd_args()
+    report('parse: regex', lambda: regex_parse_request(REQUEST), args.number)
+    report('parse: bytes', lambda: parse_request(REQUEST), args.number)
+    for request in (REQUEST, LARGE_REQUEST):
+        chunks = get_chunks(request, args.chunk_size)
+        name = f'read {len(request)}B in {len(chunks)} chunks'
+        report(f'{name}: rescan', lambda: rescan_read(chunks), args.number // 10)
+        report(f'{name}: incremental', lambda: incremental_read(chunks), args.number // 10)
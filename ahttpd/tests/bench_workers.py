@@ -0,0 +1,92 @@
+import asyncio
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+from bench import add_client_args, get_paths, run, summarize
+
+
+HTTPD = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'httpd.py')
+TIMEOUT_START = 10
+
+
+def start_server(addr, port, root, workers, server_args):
+    cmd = [
+        sys.executable, HTTPD,
+        '-a', addr, '-p', str(port), '-r', root, '-w', str(workers)
+    ] + server_args
+    return subprocess.Popen(cmd, start_new_session=True)
+
+
+def is_listening(addr, port):
+    try:
+        socket.create_connection((addr, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def stop_server(process, addr, port):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+    while is_listening(addr, port):
+        time.sleep(0.1)
+
+
+def wait_for_server(process, addr, port):
+    deadline = time.monotonic() + TIMEOUT_START
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        if is_listening(addr, port):
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f'Server did not start on {addr}:{port}')
+
+
+def run_client(args):
+    return asyncio.run(run(*args))
+
+
+def measure(args, paths):
+    client_args = (
+        args.addr, args.port, paths,
+        args.requests // args.jobs, args.concurrency, not args.no_keep_alive
+    )
+    with Pool(args.jobs) as pool:
+        return pool.map(run_client, [client_args] * args.jobs)
+
+
+def get_cmd_args():
+    parser = argparse.ArgumentParser(
+        description='Measure requests/sec for 1..N workers. '
+                    'Unknown arguments are passed to httpd.py, e.g. --reuse_port --uvloop'
+    )
+    add_client_args(parser)
+    parser.set_defaults(requests=20000)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Client processes')
+    parser.add_argument('-w', '--max_workers', type=int, default=os.cpu_count())
+    parser.add_argument('--no_keep_alive', action='store_true')
+    return parser.parse_known_args()
+
+
+if __name__ == '__main__':
+
+    args, server_args = get_cmd_args()
+    paths = get_paths(args)
+    for workers in range(1, args.max_workers + 1):
+        server = start_server(args.addr, args.port, args.root, workers, server_args)
+        try:
+            wait_for_server(server, args.addr, args.port)
+            results = measure(args, paths)
+        finally:
+            stop_server(server, args.addr, args.port)
+        print(json.dumps(summarize(
+            results, workers=workers, keep_alive=not args.no_keep_alive,
+            concurrency=args.concurrency * args.jobs, paths=len(set(paths)), mix=args.mix
+        )))
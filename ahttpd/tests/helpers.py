@@ -0,0 +1,16 @@
+import asyncio
+import contextlib
+from ahttp.server import create_socket
+
+
+@contextlib.asynccontextmanager
+async def run_server(server_class, root, **options):
+    sock = create_socket('127.0.0.1', 0)
+    server = server_class(root, sock, asyncio.get_running_loop(), graceful_timeout=1, **options)
+    serve_task = asyncio.create_task(server.serve())
+    try:
+        yield server, sock.getsockname()[1]
+    finally:
+        server.close()
+        await serve_task
+        sock.close()
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from ahttp.app import is_asgi_app, check_app
+from ahttp.server import AsyncServer
+from ahttp.protocol import ProtocolServer
+from tests.helpers import run_server
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wsgi_app(environ, start_response):
+    if environ['PATH_INFO'] == '/fail':
+        raise RuntimeError('fail')
+    body = environ['wsgi.input'].read()
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Connection', 'close')])
+    return [f"{environ['SCRIPT_NAME']}|{environ['PATH_INFO']}|".encode(), body]
+
+
+async def asgi_app(scope, receive, send):
+    message = await receive()
+    await send({'type': 'http.response.start', 'status': 201, 'headers': [(b'x-app', b'asgi')]})
+    await send({'type': 'http.response.body', 'body': f"{scope['root_path']}|{scope['path']}|".encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': message['body']})
+
+
+async def fetch(port, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def post(path, body, connection='close'):
+    return (
+        f'POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n'
+        f'Connection: {connection}\r\n\r\n'
+    ).encode() + body
+
+
+class TestAppHosting(unittest.TestCase):
+
+    async def run_requests(self, server_class, app, requests):
+        options = {'app': app, 'app_prefix': '/app/', 'max_body_size': 100}
+        async with run_server(server_class, TESTS_DIR, **options) as (_, port):
+            return [await fetch(port, request) for request in requests]
+
+    def check_app(self, server_class, app, status):
+        responses = asyncio.run(self.run_requests(server_class, app, [
+            post('/app/x%20y', b'\r\n\r\n', 'keep-alive') + post('/app', b'second'),
+            post('/application', b''),
+            b'GET /httptest/dir2/page.html HTTP/1.1\r\nConnection: close\r\n\r\n',
+            post('/app/', b'x' * 101)
+        ]))
+        pipelined, outside, static, too_large = responses
+        self.assertEqual(pipelined.count(status), 2)
+        self.assertIn(b'Connection: keep-alive\r\n', pipelined)
+        self.assertTrue(pipelined.endswith(b'|second'))
+        self.assertTrue(outside.startswith(b'HTTP/1.1 405 '))
+        self.assertTrue(static.startswith(b'HTTP/1.1 200 OK'))
+        self.assertTrue(too_large.startswith(b'HTTP/1.1 413 '))
+        return pipelined
+
+    def test_wsgi(self):
+        for server_class in (AsyncServer, ProtocolServer):
+            response = self.check_app(server_class, wsgi_app, b'HTTP/1.1 200 OK\r\n')
+            self.assertIn(b'Content-Length: 12\r\n', response)
+            self.assertIn(b'/app|/x y|\r\n\r\n', response)
+
+    def test_asgi(self):
+        for server_class in (AsyncServer, ProtocolServer):
+            response = self.check_app(server_class, asgi_app, b'HTTP/1.1 201 Created\r\n')
+            self.assertIn(b'x-app: asgi\r\nContent-Length: 16\r\n', response)
+            self.assertIn(b'/app|/app/x y|\r\n\r\n', response)
+
+    def test_application_error(self):
+        responses = asyncio.run(self.run_requests(AsyncServer, wsgi_app, [post('/app/fail', b'')]))
+        self.assertTrue(responses[0].startswith(b'HTTP/1.1 500 '))
+
+    def test_check_app_does_not_import(self):
+        with tempfile.TemporaryDirectory() as app_path:
+            with open(os.path.join(app_path, 'probe_app.py'), 'w') as f:
+                f.write('def application(environ, start_response):\n    return []\n')
+            self.assertIsNone(check_app('probe_app', app_path))
+            self.assertIn('AttributeError', check_app('probe_app:missing', app_path))
+            self.assertIn('ModuleNotFoundError', check_app('no_such_app', app_path))
+        self.assertNotIn('probe_app', sys.modules)
+
+    def test_interface_detection(self):
+        self.assertTrue(is_asgi_app(asgi_app))
+        self.assertFalse(is_asgi_app(wsgi_app))
+
+
+if __name__ == '__main__':
+    unittest.main()
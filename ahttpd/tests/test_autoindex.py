@@ -0,0 +1,73 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from ahttp.autoindex import DirectoryIndex, get_page_number, render_listing, scan_directory
+from ahttp.fileio import AsyncFileIO
+
+
+class TestScanDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.mkdir(os.path.join(self.root, 'sub'))
+        for name in ('b.txt', 'a b.txt', '.hidden'):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write(name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sorted_dirs_first_without_hidden(self):
+        names = [entry.name for entry in scan_directory(self.root)]
+        self.assertEqual(names, ['sub', 'a b.txt', 'b.txt'])
+
+    def test_rescan_sees_files_rewritten_in_place(self):
+        index = DirectoryIndex()
+        file_io = AsyncFileIO(threads=0)
+        path = os.path.join(self.root, 'b.txt')
+        with open(path, 'w') as f:
+            f.write('1')
+
+        async def get_sizes():
+            listing = await index.get_listing(self.root, os.stat(self.root), file_io)
+            return {entry.name: entry.size for entry in listing.entries}
+
+        self.assertEqual(asyncio.run(get_sizes())['b.txt'], 1)
+        inode = os.stat(path).st_ino
+        with open(path, 'w') as f:
+            f.write('x' * 12345)
+        self.assertEqual(os.stat(path).st_ino, inode)
+        os.remove(os.path.join(self.root, 'a b.txt'))
+        sizes = asyncio.run(get_sizes())
+        self.assertEqual(sizes, {'sub': sizes['sub'], 'b.txt': 12345})
+        self.assertEqual(index.scans, 2)
+
+
+class TestRenderListing(unittest.TestCase):
+
+    def test_paging(self):
+        tmp = tempfile.TemporaryDirectory()
+        with tmp:
+            for i in range(5):
+                open(os.path.join(tmp.name, f'{i}.txt'), 'w').close()
+            entries = scan_directory(tmp.name)
+        body = render_listing('/dir/', entries, 2, 2).decode()
+        self.assertIn('href="2.txt"', body)
+        self.assertNotIn('href="1.txt"', body)
+        self.assertIn('page 2 of 3', body)
+        self.assertIn('href="../"', body)
+
+    def test_escaping(self):
+        body = render_listing('/<x>/', [], 1, 10).decode()
+        self.assertIn('Index of /&lt;x&gt;/', body)
+
+    def test_page_number(self):
+        self.assertEqual(get_page_number(''), 1)
+        self.assertEqual(get_page_number('page=3'), 3)
+        self.assertIsNone(get_page_number('page=x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import unittest
+from ahttp.cache import FileCache, LRUCache
+
+
+def make_stat(size, mtime=1, inode=1):
+    return os.stat_result((0, inode, 0, 0, 0, 0, size, 0, 0, 0, 0, 0, 0, 0, mtime, 0))
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FileCache(max_size=10, max_file_size=6)
+
+    def put(self, path, content, **kwargs):
+        stat = make_stat(len(content), **kwargs)
+        return self.cache.put(path, stat, content, b'headers', 'text/plain')
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('/a', make_stat(3)))
+        self.put('/a', b'abc')
+        self.assertEqual(self.cache.get('/a', make_stat(3)).content, b'abc')
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_uncacheable_is_not_a_miss(self):
+        self.assertIsNone(self.cache.get('/large', make_stat(7)))
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+    def test_invalidation(self):
+        self.put('/a', b'abc')
+        self.assertIsNone(self.cache.get('/a', make_stat(3, mtime=2)))
+        self.put('/a', b'abc')
+        self.assertIsNone(self.cache.get('/a', make_stat(4)))
+        self.put('/a', b'abc')
+        self.assertIsNone(self.cache.get('/a', make_stat(3, inode=2)))
+        self.assertEqual(self.cache.stats()['invalidations'], 3)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_lru_eviction(self):
+        self.put('/a', b'aaaa')
+        self.put('/b', b'bbbb')
+        self.cache.get('/a', make_stat(4))
+        self.put('/c', b'cccc')
+        self.assertIn('/a', self.cache.entries)
+        self.assertNotIn('/b', self.cache.entries)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.size, 8)
+
+    def test_large_file_not_cached(self):
+        self.assertIsNone(self.put('/a', b'1234567'))
+        self.assertEqual(self.cache.size, 0)
+
+
+class TestHeaderCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LRUCache(max_entries=2)
+        cache.put('a', b'A')
+        cache.put('b', b'B')
+        self.assertEqual(cache.get('a'), b'A')
+        cache.put('c', b'C')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'entries': 2, 'max_entries': 2, 'hits': 1, 'misses': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from ahttp.fileio import AsyncFileIO, RWF_NOWAIT, SENDFILE_CHUNK_SIZE
+from ahttp.server import AsyncServer
+from ahttp.protocol import ProtocolServer
+from tests.helpers import run_server
+
+
+FILE_SIZE = SENDFILE_CHUNK_SIZE * 3 + 100
+# dropping the page cache is only advice to the kernel and is not always followed
+DROP_ATTEMPTS = 20
+
+
+def drop_page_cache(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    response = await reader.read()
+    writer.close()
+    return response.partition(b'\r\n\r\n')[2]
+
+
+@unittest.skipIf(RWF_NOWAIT is None, 'RWF_NOWAIT is not supported')
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cold.bin')
+        self.content = os.urandom(FILE_SIZE)
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+            os.fsync(f.fileno())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cold_range_is_read_in_thread(self):
+        for _ in range(DROP_ATTEMPTS):
+            drop_page_cache(self.path)
+            file_io = AsyncFileIO(threads=1)
+            with open(self.path, 'rb') as f:
+                asyncio.run(file_io.prefetch(f, 0, SENDFILE_CHUNK_SIZE))
+                if file_io.prefetched:
+                    self.assertTrue(file_io.is_cached(f, 0, SENDFILE_CHUNK_SIZE))
+                    asyncio.run(file_io.prefetch(f, 0, SENDFILE_CHUNK_SIZE))
+                    self.assertEqual(file_io.stats()['prefetched'], 1)
+                    return
+        self.skipTest('the page cache of the file cannot be dropped')
+
+    async def fetch(self, server_class):
+        async with run_server(server_class, self.tmp.name) as (server, port):
+            body = await get(port, '/cold.bin')
+            return body, server.file_io.stats()['prefetched']
+
+    def test_servers_prefetch_before_sendfile(self):
+        for server_class in (AsyncServer, ProtocolServer):
+            with self.subTest(server_class=server_class.__name__):
+                for _ in range(DROP_ATTEMPTS):
+                    drop_page_cache(self.path)
+                    body, prefetched = asyncio.run(self.fetch(server_class))
+                    self.assertEqual(body, self.content)
+                    if prefetched:
+                        break
+                else:
+                    self.skipTest('the page cache of the file cannot be dropped')
+
+
+if __name__ == '__main__':
+    unittest.main()
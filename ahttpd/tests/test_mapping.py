@@ -0,0 +1,92 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from ahttp.fileio import AsyncFileIO
+from ahttp.mapping import FileMapping, MappingCache
+from ahttp.server import AsyncServer
+from ahttp.protocol import ProtocolServer
+from tests.helpers import run_server
+
+
+TRUNCATED_FILE_SIZE = 8 * 1024 * 1024
+
+
+class TestMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'data.bin')
+        self.write(bytes(range(256)) * 100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, content):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+
+    def test_chunks_of_range(self):
+        mapping = FileMapping(self.path)
+        chunks = list(mapping.iter_chunks(5000, 10000, chunk_size=4096))
+        self.assertEqual([len(chunk) for chunk in chunks], [4096, 4096, 1808])
+        self.assertEqual(b''.join(chunks), (bytes(range(256)) * 100)[5000:15000])
+
+    def test_cache_is_shared_and_invalidated(self):
+        cache = MappingCache()
+        file_io = AsyncFileIO(threads=0)
+
+        async def get():
+            return await cache.get(self.path, os.stat(self.path), file_io)
+
+        first = asyncio.run(get())
+        self.assertIs(asyncio.run(get()), first)
+        os.remove(self.path)
+        self.write(b'new content')
+        second = asyncio.run(get())
+        self.assertIsNot(second, first)
+        self.assertEqual(bytes(second.view), b'new content')
+        self.assertEqual(cache.stats()['opened'], 2)
+
+
+class TestTruncatedMapping(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'big.bin')
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * TRUNCATED_FILE_SIZE)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def get(self, port, limit=1024, truncate=False):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=limit)
+        writer.write(b'GET /big.bin HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+        head = await reader.readuntil(b'\r\n\r\n')
+        if truncate:
+            # the client does not read, so the server is still sending when the file shrinks
+            await asyncio.sleep(0.1)
+            os.truncate(self.path, 4096)
+        body = await reader.read()
+        writer.close()
+        return head.split(b'\r\n', 1)[0], len(body)
+
+    async def run_server(self, server_class):
+        async with run_server(server_class, self.tmp.name, use_mmap=True) as (_, port):
+            with self.assertLogs(level='WARNING') as logs:
+                _, received = await self.get(port, truncate=True)
+            self.assertLess(received, TRUNCATED_FILE_SIZE)
+            self.assertIn('Connection failed', logs.output[0])
+            # the worker keeps serving after the failed send
+            self.assertEqual(await self.get(port), (b'HTTP/1.1 200 OK', 4096))
+
+    def test_async_server(self):
+        asyncio.run(self.run_server(AsyncServer))
+
+    def test_protocol_server(self):
+        asyncio.run(self.run_server(ProtocolServer))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import unittest
+from ahttp.cache import FileCache
+from ahttp.fileio import AsyncFileIO
+from ahttp.metrics import Histogram, Metrics, MetricsStore, LATENCY_BUCKETS
+from ahttp.request_handler import Response
+from tests.test_cache import make_stat
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram()
+        histogram.observe(LATENCY_BUCKETS[0])
+        histogram.observe(0.003)
+        histogram.observe(100)
+        self.assertEqual(histogram.counts[0], 1)
+        self.assertEqual(histogram.counts[LATENCY_BUCKETS.index(0.005)], 1)
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(sum(histogram.counts), 3)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics([200, 404])
+        self.metrics.count_connection(0.0001)
+        self.metrics.count_response(Response(b'HTTP/1.1 404 Not Found\r\n\r\n', b'body'), 0.001)
+        self.metrics.count_response(Response(b'HTTP/1.1 302 Found\r\n\r\n'), 0.001)
+
+    def test_layout(self):
+        values = self.metrics.values()
+        self.assertEqual(len(values), len(self.metrics))
+        counters, statuses, phases, caches, file_io = self.metrics.unpack(values)
+        self.assertEqual(
+            counters,
+            {'connections': 1, 'sent_bytes': 52, 'header_timeouts': 0, 'accept_pauses': 0}
+        )
+        self.assertEqual(statuses, {0: 1, 200: 0, 404: 1})
+        self.assertEqual(sum(phases['send'][0]), 2)
+        self.assertEqual(list(phases), ['accept', 'parse', 'handle', 'send'])
+        self.assertEqual(caches['file']['hits'], 0)
+        self.assertEqual(
+            file_io, {'pending': 0, 'max_pending': 0, 'completed': 0, 'prefetched': 0}
+        )
+
+    def test_store_aggregates_workers(self):
+        store = MetricsStore(3, len(self.metrics))
+        self.metrics.attach(store, 0)
+        store.write(2, 42, Metrics([200, 404]).values())
+        self.assertEqual([pid for pid, _ in self.metrics.collect()][1:], [42])
+        store.clear(2)
+        self.assertEqual(len(self.metrics.collect()), 1)
+
+    def test_render(self):
+        text = self.metrics.render()
+        self.assertIn('status="404"} 1\n', text)
+        self.assertIn('status="other"} 1\n', text)
+        self.assertIn('phase="send",le="+Inf"} 2\n', text)
+        self.assertIn('ahttpd_phase_seconds_count{', text)
+        self.assertNotIn('ahttpd_cache_', text)
+
+    def test_cache_stats(self):
+        cache = FileCache(10, 10)
+        stat = make_stat(5)
+        cache.get('a', stat)
+        cache.put('a', stat, b'12345', b'', 'text/plain')
+        cache.get('a', stat)
+        cache.put('b', stat, b'123456', b'', 'text/plain')
+        self.metrics.add_cache('file', cache)
+        caches = self.metrics.unpack(self.metrics.values())[3]
+        self.assertEqual(
+            caches['file'],
+            {'entries': 1, 'size': 6, 'hits': 1, 'misses': 1, 'evictions': 1, 'invalidations': 0}
+        )
+        text = self.metrics.render()
+        self.assertIn(f'ahttpd_cache_hits_total{{worker="{os.getpid()}",cache="file"}} 1\n', text)
+        self.assertIn('# TYPE ahttpd_cache_size_bytes gauge\n', text)
+        self.assertNotIn('cache="encoding"', text)
+
+    def test_file_io_stats(self):
+        file_io = AsyncFileIO(threads=1)
+        self.metrics.set_file_io(file_io)
+        asyncio.run(file_io.stat(__file__))
+        file_io.pending = 3
+        file_io.max_pending = 5
+        text = self.metrics.render()
+        self.assertIn(f'ahttpd_file_io_pending{{worker="{os.getpid()}"}} 3\n', text)
+        self.assertIn(f'ahttpd_file_io_max_pending{{worker="{os.getpid()}"}} 5\n', text)
+        self.assertIn(f'ahttpd_file_io_completed_total{{worker="{os.getpid()}"}} 1\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
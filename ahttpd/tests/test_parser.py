@@ -0,0 +1,80 @@
+import unittest
+from ahttp.parser import RequestReader, parse_request
+
+
+REQUEST = b'GET /index.html HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+POST_REQUEST = b'POST /app HTTP/1.1\r\nHost: localhost\r\ncontent-LENGTH: 8\r\n\r\na\r\n\r\nbcd'
+
+
+class TestRequestReader(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = RequestReader(max_message_len=100)
+
+    def test_request_in_chunks(self):
+        for i in range(len(REQUEST) - 1):
+            self.reader.feed(REQUEST[i:i + 1])
+            self.assertIsNone(self.reader.next_request())
+        self.reader.feed(REQUEST[-1:])
+        self.assertEqual(self.reader.next_request(), REQUEST)
+        self.assertEqual(len(self.reader), 0)
+
+    def test_pipelined_requests(self):
+        self.reader.feed(REQUEST * 2 + b'GET /')
+        self.assertEqual(self.reader.next_request(), REQUEST)
+        self.assertEqual(self.reader.next_request(), REQUEST)
+        self.assertIsNone(self.reader.next_request())
+        self.assertEqual(self.reader.flush(), b'GET /')
+
+    def test_overflow(self):
+        self.reader.feed(b'x' * 101)
+        self.assertTrue(self.reader.is_overflow())
+
+    def test_request_with_body(self):
+        self.reader.feed(POST_REQUEST[:-3])
+        self.assertIsNone(self.reader.next_request())
+        self.assertEqual(self.reader.pending(), 3)
+        self.reader.feed(POST_REQUEST[-3:] + REQUEST)
+        self.assertEqual(self.reader.next_request(), POST_REQUEST)
+        self.assertEqual(self.reader.next_request(), REQUEST)
+
+    def test_body_overflow(self):
+        reader = RequestReader(max_body_len=7)
+        reader.feed(POST_REQUEST[:-1])
+        self.assertIsNone(reader.next_request())
+        self.assertTrue(reader.is_overflow())
+
+
+class TestParseRequest(unittest.TestCase):
+
+    def test_valid_request(self):
+        request = parse_request(REQUEST)
+        self.assertEqual(request.method, 'GET')
+        self.assertEqual(request.uri, '/index.html')
+        self.assertEqual(request.version, '1.1')
+        self.assertEqual(request.headers, {'host': 'localhost', 'connection': 'close'})
+
+    def test_request_body(self):
+        self.assertEqual(parse_request(POST_REQUEST).body, b'a\r\n\r\nbcd')
+        self.assertIsNone(parse_request(POST_REQUEST[:-1]).body)
+        self.assertEqual(parse_request(REQUEST).body, b'')
+        request = POST_REQUEST.replace(b'8', b'4').replace(b'bcd', b'')
+        self.assertEqual(parse_request(request[:-1]).body, b'a\r\n\r')
+
+    def test_request_without_headers(self):
+        self.assertEqual(parse_request(b'HEAD / HTTP/1.0\r\n\r\n').headers, {})
+
+    def test_invalid_requests(self):
+        for data in (
+            b'GET /\r\n\r\n',
+            b'GET / HTTP/2.0\r\n\r\n',
+            b'GET  / HTTP/1.1\r\n\r\n',
+            b'GET / HTTP/1.1\r\nbroken header\r\n\r\n',
+            b'GET / HTTP/1.1\r\n',
+            b'GET / HTTP/1.1\r\nContent-Length: -1\r\n\r\n',
+        ):
+            self.assertIsNone(parse_request(data), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from email.utils import formatdate
+from ahttp.cache import FileCache
+from ahttp.request_handler import AsyncRequestHandler
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+def build_request(path, **headers):
+    lines = [f'GET {path} HTTP/1.1', 'Host: localhost']
+    lines += [f'{name.replace("_", "-")}: {value}' for name, value in headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+
+def get_header(head, name):
+    for line in head.decode().split('\r\n')[1:]:
+        key, _, value = line.partition(': ')
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+class TestRequestHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        self.path = os.path.join(self.root, 'data.bin')
+        with open(self.path, 'wb') as f:
+            f.write(CONTENT)
+        self.stat = os.stat(self.path)
+        self.handler = AsyncRequestHandler(self.root)
+        self.etag = self.handler.get_etag(self.stat)
+        self.last_modified = self.handler.get_last_modified(self.stat)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def get(self, path='/data.bin', **headers):
+        async def get():
+            response = await self.handler.get_response(build_request(path, **headers))
+            body = response.body
+            if response.file is not None:
+                with response.file:
+                    response.file.seek(response.offset)
+                    body += response.file.read(response.count)
+            return response.head, body
+        return asyncio.run(get())
+
+    def get_status(self, **headers):
+        head, _ = self.get(**headers)
+        return int(head[9:12])
+
+
+class TestRanges(TestRequestHandler):
+
+    def test_parse_range(self):
+        cases = {
+            'bytes=0-99': (0, 99),
+            'bytes=1000-2000': (1000, 1023),
+            'bytes=1000-': (1000, 1023),
+            'bytes=-100': (924, 1023),
+            'bytes=-5000': (0, 1023),
+            'bytes=2000-': (2000, 1023),
+            'bytes=100-99': None,
+            'bytes=-': None,
+            'bytes=0-1,5-6': None,
+            'items=0-1': None,
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(self.handler.parse_range(value, len(CONTENT)), expected)
+
+    def test_suffix_range(self):
+        head, body = self.get(range='bytes=-100')
+        self.assertTrue(head.startswith(b'HTTP/1.1 206 '))
+        self.assertEqual(get_header(head, 'Content-Range'), 'bytes 924-1023/1024')
+        self.assertEqual(body, CONTENT[-100:])
+
+    def test_open_ended_range(self):
+        head, body = self.get(range='bytes=1000-')
+        self.assertEqual(get_header(head, 'Content-Range'), 'bytes 1000-1023/1024')
+        self.assertEqual(get_header(head, 'Content-Length'), '24')
+        self.assertEqual(body, CONTENT[1000:])
+
+    def test_reversed_range_is_ignored(self):
+        head, body = self.get(range='bytes=500-100')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 '))
+        self.assertEqual(body, CONTENT)
+
+    def test_start_past_end(self):
+        for value in ('bytes=1024-', 'bytes=5000-6000', 'bytes=-0'):
+            with self.subTest(value=value):
+                head, _ = self.get(range=value)
+                self.assertTrue(head.startswith(b'HTTP/1.1 416 '))
+                self.assertEqual(get_header(head, 'Content-Range'), 'bytes */1024')
+
+
+class TestConditionals(TestRequestHandler):
+
+    def test_etag_match(self):
+        gzip_etag = self.handler.get_etag(self.stat, 'gzip')
+        cases = {
+            self.etag: True,
+            f'W/{self.etag}': True,
+            f'"other", {self.etag}': True,
+            gzip_etag: True,
+            '*': True,
+            ' * ': True,
+            '"other"': False,
+            'W/"other"': False,
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(self.handler.is_etag_matched(value, self.stat), expected)
+
+    def test_if_none_match(self):
+        self.assertEqual(self.get_status(if_none_match=f'W/{self.etag}'), 304)
+        self.assertEqual(self.get_status(if_none_match='*'), 304)
+        self.assertEqual(self.get_status(if_none_match='"other"'), 200)
+
+    def test_if_modified_since(self):
+        self.assertEqual(self.get_status(if_modified_since=self.last_modified), 304)
+        earlier = formatdate(self.stat.st_mtime - 3600, usegmt=True)
+        self.assertEqual(self.get_status(if_modified_since=earlier), 200)
+        self.assertEqual(self.get_status(if_modified_since='yesterday'), 200)
+
+    def test_if_none_match_takes_precedence(self):
+        earlier = formatdate(self.stat.st_mtime - 3600, usegmt=True)
+        status = self.get_status(if_none_match=self.etag, if_modified_since=earlier)
+        self.assertEqual(status, 304)
+        status = self.get_status(if_none_match='"other"', if_modified_since=self.last_modified)
+        self.assertEqual(status, 200)
+
+    def test_if_range_etag(self):
+        self.assertEqual(self.get_status(range='bytes=0-9', if_range=self.etag), 206)
+        self.assertEqual(self.get_status(range='bytes=0-9', if_range='"other"'), 200)
+        # If-Range requires a strong comparison
+        self.assertEqual(self.get_status(range='bytes=0-9', if_range=f'W/{self.etag}'), 200)
+
+    def test_if_range_date(self):
+        self.assertEqual(self.get_status(range='bytes=0-9', if_range=self.last_modified), 206)
+        earlier = formatdate(self.stat.st_mtime - 3600, usegmt=True)
+        self.assertEqual(self.get_status(range='bytes=0-9', if_range=earlier), 200)
+
+
+class TestEncoding(TestRequestHandler):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('image.png', 'script.js', 'script.js.gz'):
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(CONTENT)
+        self.handler = AsyncRequestHandler(self.root, encoding_cache=FileCache())
+        self.stats = []
+        stat = self.handler.file_io.stat
+
+        async def counting_stat(path):
+            self.stats.append(os.path.basename(path))
+            return await stat(path)
+
+        self.handler.file_io.stat = counting_stat
+
+    def test_no_sibling_probes_for_images(self):
+        head, _ = self.get('/image.png', accept_encoding='gzip, br')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 '))
+        self.assertEqual(self.stats, ['image.png'])
+
+    def test_precompressed_sibling(self):
+        head, _ = self.get('/script.js', accept_encoding='gzip')
+        self.assertEqual(get_header(head, 'Content-Encoding'), 'gzip')
+        self.assertEqual(self.stats, ['script.js', 'script.js.gz'])
+
+    def test_not_modified_repeats_encoded_etag(self):
+        stat = os.stat(os.path.join(self.root, 'script.js'))
+        gzip_etag = self.handler.get_etag(stat, 'gzip')
+        head, _ = self.get('/script.js', accept_encoding='gzip', if_none_match=f'W/{gzip_etag}')
+        self.assertTrue(head.startswith(b'HTTP/1.1 304 '))
+        self.assertEqual(get_header(head, 'ETag'), gzip_etag)
+        self.assertEqual(get_header(head, 'Vary'), 'Accept-Encoding')
+        head, _ = self.get('/script.js', if_none_match=self.handler.get_etag(stat))
+        self.assertEqual(get_header(head, 'ETag'), self.handler.get_etag(stat))
+
+
+if __name__ == '__main__':
+    unittest.main()
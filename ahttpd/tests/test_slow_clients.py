@@ -0,0 +1,84 @@
+import asyncio
+import os
+import time
+import unittest
+from ahttp.server import AsyncServer
+from ahttp.protocol import ProtocolServer
+from tests.helpers import run_server
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REQUEST = b'GET /httptest/dir2/page.html HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'
+SLOW_CLIENTS = 100
+FAST_CLIENTS = 10
+MAX_CONNECTIONS = 20
+HEADER_TIMEOUT = 0.3
+SLOW_CLIENT_DELAY = 0.05
+
+
+async def slow_client(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for byte in REQUEST:
+            writer.write(bytes([byte]))
+            try:
+                await asyncio.wait_for(reader.read(1024), SLOW_CLIENT_DELAY)
+                break
+            except asyncio.TimeoutError:
+                pass
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def fast_client(port):
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(REQUEST)
+    response = await reader.read()
+    writer.close()
+    return time.perf_counter() - started, response.split(b'\r\n', 1)[0]
+
+
+async def watch_connections(server, peak):
+    while True:
+        peak[0] = max(peak[0], len(server.connections))
+        await asyncio.sleep(0.01)
+
+
+class TestSlowClients(unittest.TestCase):
+
+    async def run_clients(self, server_class):
+        options = {'max_connections': MAX_CONNECTIONS, 'header_timeout': HEADER_TIMEOUT}
+        async with run_server(server_class, TESTS_DIR, **options) as (server, port):
+            peak = [0]
+            watch_task = asyncio.create_task(watch_connections(server, peak))
+            slow_tasks = [asyncio.create_task(slow_client(port)) for _ in range(SLOW_CLIENTS)]
+            await asyncio.sleep(0.1)
+            results = await asyncio.gather(*(fast_client(port) for _ in range(FAST_CLIENTS)))
+            await asyncio.gather(*slow_tasks, return_exceptions=True)
+            watch_task.cancel()
+        return results, peak[0], server.metrics.counters
+
+    def check_server(self, server_class):
+        results, peak, counters = asyncio.run(self.run_clients(server_class))
+        latencies = [latency for latency, _ in results]
+        self.assertEqual({status for _, status in results}, {b'HTTP/1.1 200 OK'})
+        # every batch of slow clients holding the connection slots is cut
+        # off by the header deadline, however often they send a byte
+        bound = HEADER_TIMEOUT * (SLOW_CLIENTS / MAX_CONNECTIONS + 2)
+        self.assertLess(max(latencies), bound)
+        self.assertGreater(counters['header_timeouts'], 0)
+        self.assertGreater(counters['accept_pauses'], 0)
+        self.assertLessEqual(peak, MAX_CONNECTIONS)
+
+    def test_socket_core(self):
+        self.check_server(AsyncServer)
+
+    def test_protocol_core(self):
+        self.check_server(ProtocolServer)
+
+
+if __name__ == '__main__':
+    unittest.main()